@@ -0,0 +1,222 @@
+import logging
+import os
+import struct
+import threading
+from time import perf_counter, sleep
+from typing import Callable
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+PCM_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.uint8,
+    (WAVE_FORMAT_PCM, 16): np.int16,
+    (WAVE_FORMAT_PCM, 32): np.int32,
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.float32,
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.float64,
+}
+
+
+class AudioFile:
+    def __init__(
+        self,
+        path: str,
+        samplerate: int | None = None,
+        channels: int | None = None,
+        dtype: str | None = None,
+    ) -> None:
+        self.path = path
+
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == ".wav":
+            self.__open_wav()
+        elif extension in (".raw", ".pcm"):
+            if not samplerate or not channels or not dtype:
+                raise ValueError("Raw PCM needs a samplerate, channels and dtype")
+
+            self.samplerate = samplerate
+            self.channels = channels
+            self.__map(np.dtype(dtype), 0)
+        elif soundfile is not None:
+            data, self.samplerate = soundfile.read(
+                path, dtype="float32", always_2d=True
+            )
+            self.channels = data.shape[1]
+            self.data = data
+            self.__offset, self.__scale = 0.0, 1.0
+        else:
+            raise ValueError(f"Reading {extension} files requires soundfile")
+
+        self.frames = self.data.shape[0]
+        self.duration = self.frames / self.samplerate
+
+    def __open_wav(self) -> None:
+        with open(self.path, "rb") as f:
+            riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave != b"WAVE":
+                raise ValueError(f"{self.path} is not a RIFF/WAVE file")
+
+            audio_format = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{self.path} has no data chunk")
+
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+
+                if chunk_id == b"fmt ":
+                    fmt = f.read(chunk_size + chunk_size % 2)
+                    audio_format, channels, samplerate = struct.unpack("<HHI", fmt[:8])
+                    bits = struct.unpack("<H", fmt[14:16])[0]
+
+                    if audio_format == WAVE_FORMAT_EXTENSIBLE:
+                        audio_format = struct.unpack("<H", fmt[24:26])[0]
+                elif chunk_id == b"data":
+                    offset, size = f.tell(), chunk_size
+                    break
+                else:
+                    f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+        if audio_format is None:
+            raise ValueError(f"{self.path} has no fmt chunk before its data")
+
+        dtype = PCM_DTYPES.get((audio_format, bits))
+
+        if dtype is None:
+            if soundfile is None:
+                raise ValueError(
+                    f"Unsupported WAV encoding ({audio_format}, {bits} bit),"
+                    " install soundfile to read it"
+                )
+
+            data, self.samplerate = soundfile.read(
+                self.path, dtype="float32", always_2d=True
+            )
+            self.channels = data.shape[1]
+            self.data = data
+            self.__offset, self.__scale = 0.0, 1.0
+
+            return
+
+        self.samplerate = samplerate
+        self.channels = channels
+        self.__map(np.dtype(dtype), offset, size)
+
+    def __map(self, dtype: np.dtype, offset: int, size: int | None = None) -> None:
+        available = os.path.getsize(self.path) - offset
+        size = available if size is None else min(size, available)
+        frames = size // (dtype.itemsize * self.channels)
+
+        self.data = np.memmap(
+            self.path,
+            dtype=dtype,
+            mode="r",
+            offset=offset,
+            shape=(frames, self.channels),
+        )
+
+        if dtype.kind == "u":
+            self.__offset = float(2 ** (dtype.itemsize * 8 - 1))
+            self.__scale = 1 / self.__offset
+        elif dtype.kind == "i":
+            self.__offset = 0.0
+            self.__scale = 1 / 2 ** (dtype.itemsize * 8 - 1)
+        else:
+            self.__offset, self.__scale = 0.0, 1.0
+
+    def read(self, start: int, out: np.ndarray) -> int:
+        frames = min(out.shape[0], self.frames - start)
+
+        if frames <= 0:
+            return 0
+
+        np.subtract(self.data[start : start + frames], self.__offset, out=out[:frames])
+        np.multiply(out[:frames], self.__scale, out=out[:frames])
+        out[frames:] = 0
+
+        return frames
+
+    def read_blocks(self, start_block: int, count: int, blocksize: int) -> np.ndarray:
+        blocks = np.zeros((count * blocksize, self.channels), dtype=np.float32)
+        self.read(start_block * blocksize, blocks)
+
+        return blocks.reshape(count, blocksize, self.channels)
+
+
+class AudioFileStream:
+    def __init__(
+        self,
+        audio_file: AudioFile,
+        blocksize: int,
+        callback: Callable,
+        finished_callback: Callable | None = None,
+        realtime: bool = True,
+    ) -> None:
+        self.audio_file = audio_file
+        self.samplerate = audio_file.samplerate
+        self.channels = audio_file.channels
+        self.blocksize = blocksize
+        self.realtime = realtime
+
+        self.__callback = callback
+        self.__finished_callback = finished_callback
+
+        self.__block = np.zeros((blocksize, self.channels), dtype=np.float32)
+        self.__running = False
+        self.__thread = None
+
+    def start(self) -> None:
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self) -> None:
+        block_time = self.blocksize / self.samplerate
+        start_time = perf_counter()
+        position = 0
+        blocks = 0
+
+        # Whatever ends playback, the finished callback is what tells the
+        # backends to stop, so it must always run.
+        try:
+            while self.__running:
+                frames = self.audio_file.read(position, self.__block)
+                if frames == 0:
+                    break
+
+                if self.realtime:
+                    delay = start_time + (blocks + 1) * block_time - perf_counter()
+                    if delay > 0:
+                        sleep(delay)
+
+                self.__callback(self.__block, self.blocksize, None, None)
+
+                position += frames
+                blocks += 1
+        except Exception:
+            logger.exception(f"Audio File Playback Failed After {blocks} Blocks")
+        finally:
+            self.__running = False
+
+            if self.__finished_callback:
+                self.__finished_callback()
+
+    def stop(self) -> None:
+        self.__running = False
+
+        if self.__thread and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+    def close(self) -> None:
+        self.stop()
@@ -1,12 +1,96 @@
-from typing import Callable, Tuple
+import logging
+import re
+from time import monotonic, perf_counter
+from typing import Callable, List, Tuple
 
 import numpy as np
 import sounddevice as sd
 
-from utils import clamp
+from audio_file_source import AudioFile, AudioFileStream
+from band_normalizer import BandNormalizer
+from frame_math import clip, quantize, scale
+from frame_smoother import FrameSmoother
+from onset_detector import BEAT_FRAME_SIZE, OnsetDetector
+from pipeline_metrics import MetricsRegistry
+from spectrum_analyzer import SpectrumAnalyzer, build_bands
+
+logger = logging.getLogger(__name__)
 
 
 class AudioInputStreamManager:
+    audio_file: AudioFile | None = None
+
+    def initialize_file_source(
+        self,
+        path: str,
+        realtime: bool = True,
+        samplerate: int | None = None,
+        channels: int | None = None,
+        dtype: str | None = None,
+    ) -> None:
+        self.audio_file = AudioFile(path, samplerate, channels, dtype)
+        self.realtime = realtime
+
+        self.input_device = None
+        self.samplerate = self.audio_file.samplerate
+        self.channels = self.audio_file.channels
+
+        logger.info(
+            f"Input File: {path}, Samplerate: {self.samplerate},"
+            f" Channels: {self.channels}, Duration: {self.audio_file.duration:.1f} s"
+        )
+
+    @staticmethod
+    def list_devices() -> str:
+        return str(sd.query_devices())
+
+    def select_input_device(self, device: str, channels: int | None = None) -> bool:
+        if device == "default":
+            device_details = dict(sd.query_devices(kind="input"))
+        else:
+            try:
+                pattern = re.compile(device, re.IGNORECASE)
+            except re.error:
+                pattern = re.compile(re.escape(device), re.IGNORECASE)
+
+            matches = [
+                dict(details)
+                for details in sd.query_devices()
+                if details["max_input_channels"] > 0
+                and (
+                    str(details["index"]) == device
+                    if device.isdigit()
+                    else pattern.search(details["name"])
+                )
+            ]
+
+            if not matches:
+                logger.error(f"No Input Device Matches {device!r}")
+                return False
+
+            device_details = matches[0]
+
+        max_channel_in = int(device_details["max_input_channels"])
+        channels = channels or min(max_channel_in, 2)
+
+        if not 0 < channels <= max_channel_in:
+            logger.error(
+                f"{device_details['name']} Supports 1 To {max_channel_in} Channels,"
+                f" Not {channels}"
+            )
+            return False
+
+        self.input_device = int(device_details["index"])
+        self.samplerate = int(device_details["default_samplerate"])
+        self.channels = channels
+
+        logger.info(
+            f"Input Device: {device_details['name']}, Samplerate: {self.samplerate},"
+            f" Channels: {self.channels}"
+        )
+
+        return True
+
     def initialize_input_device(self) -> None:
         device_list = sd.query_devices()
         print(device_list, end="\n\n")
@@ -60,95 +144,226 @@ class AudioInputStreamManager:
     def build_stream(
         self,
         ms: float = 100,
-        latency: float | None = None,
+        output_ms: float | None = None,
+        smoothing: str = "mean",
+        latency: float | str | None = None,
+        blocksize: int = 1024,
         callback: Callable | None = None,
         finished_callback: Callable | None = None,
+        beat_callback: Callable | None = None,
+        block_callback: Callable | None = None,
+        onset_sensitivity: float = 1.5,
+        onset_window_ms: float = 1000,
+        onset_min_interval_ms: float = 100,
+        normalize: bool = True,
+        normalize_decay_ms: float = 5000,
+        normalize_range_db: float = 24,
+        normalize_gate_db: float = -70,
+        fft_backend: str = "auto",
+        band_layout: str = "rgb",
+        band_count: int = 3,
+        band_edges: List[float] | None = None,
+        metrics: MetricsRegistry | None = None,
     ) -> None:
-        self.stream = sd.InputStream(
+        if self.audio_file is not None:
+            self.stream = AudioFileStream(
+                self.audio_file,
+                blocksize=blocksize,
+                callback=self.__listen,
+                finished_callback=self.__finish,
+                realtime=self.realtime,
+            )
+        else:
+            self.stream = sd.InputStream(
+                samplerate=self.samplerate,
+                blocksize=blocksize,
+                device=self.input_device,
+                channels=self.channels,
+                dtype="float32",
+                latency=latency,
+                callback=self.__listen,
+                finished_callback=self.__finish,
+                clip_off=None,
+                dither_off=None,
+                never_drop_input=None,
+                prime_output_buffers_using_stream_callback=None,
+            )
+
+        blocksize = self.stream.blocksize
+        bands = build_bands(band_layout, band_count, edges=band_edges)
+
+        normalizer = None
+        if normalize:
+            normalizer = BandNormalizer(
+                len(bands),
+                self.samplerate,
+                blocksize,
+                decay_ms=normalize_decay_ms,
+                range_db=normalize_range_db,
+                gate_db=normalize_gate_db,
+            )
+
+        self.analyzer = SpectrumAnalyzer(
             samplerate=self.samplerate,
-            blocksize=1024,
-            device=self.input_device,
+            blocksize=blocksize,
             channels=self.channels,
-            dtype="float32",
-            latency=latency,
-            callback=self.__listen,
-            finished_callback=self.__finish,
-            clip_off=None,
-            dither_off=None,
-            never_drop_input=None,
-            prime_output_buffers_using_stream_callback=None,
+            bands=bands,
+            fft_backend=fft_backend,
+            normalizer=normalizer,
         )
-
-        blocksize = self.stream.blocksize
-        print(f"Block Size: {blocksize}")
-
-        self.freqs = np.fft.rfftfreq(blocksize, 1.0 / self.samplerate)
-        self.bands = {
-            "low": self.__find_lower_and_upper_freqs(20, 250),
-            "mid": self.__find_lower_and_upper_freqs(250, 4000),
-            "high": self.__find_lower_and_upper_freqs(4000, 12000),
-        }
+        self.freqs = self.analyzer.freqs
+        self.bands = self.analyzer.bands
+
+        self.onsets = OnsetDetector(
+            self.freqs.shape[0],
+            self.samplerate,
+            blocksize,
+            sensitivity=onset_sensitivity,
+            window_ms=onset_window_ms,
+            min_interval_ms=onset_min_interval_ms,
+        )
+        self.__beat = np.zeros(BEAT_FRAME_SIZE, dtype=np.uint8)
 
         self.callback = callback
         self.finished_callback = finished_callback
+        self.beat_callback = beat_callback
+        self.block_callback = block_callback
 
-        self.data = []
-        self.samples_to_average = int((ms * self.samplerate) / (blocksize * 1000))
+        self.frame_size = 4 + self.bands.shape[0]
+        self.__frame = np.zeros(self.frame_size, dtype=np.uint8)
+        self.__sample = np.zeros(self.frame_size, dtype=np.float64)
+        self.__output = np.zeros(self.frame_size, dtype=np.float64)
 
-        print()
-        print(f"Block Size: {blocksize}")
-        print(f"Freqs Shape: {self.freqs.shape}")
-        print(f"Freqs Interval: {self.freqs[1]}")
-        print(f"Freqs Max: {self.freqs[-1]}")
-        print(f"Bands Freqs: {self.bands}")
-        print(f"Samples Number: {self.samples_to_average}")
-        print()
-
-    def __find_lower_and_upper_freqs(self, ll: int, hl: int) -> Tuple[int, int]:
-        li = list(map(lambda x: x > ll, self.freqs)).index(True) - 1
-        ri = list(map(lambda x: x < hl, self.freqs)).index(False) + 1
+        self.samples_to_average = max(
+            round((ms * self.samplerate) / (blocksize * 1000)), 1
+        )
+        self.samples_per_output = max(
+            round(((output_ms or ms) * self.samplerate) / (blocksize * 1000)), 1
+        )
+        self.smoother = FrameSmoother(
+            self.frame_size, self.samples_to_average, mode=smoothing
+        )
+        self.__samples_since_output = 0
 
-        return li, ri
+        self.metrics = metrics or MetricsRegistry()
+        self.metrics.describe(
+            "audio_callback_seconds", "histogram", "Time spent in the audio callback"
+        )
+        self.metrics.describe(
+            "audio_input_overflows_total", "counter", "Input blocks the device dropped"
+        )
+        self.metrics.describe(
+            "frames_published_total", "counter", "Frames handed to the callback"
+        )
+        self.metrics.describe(
+            "beats_published_total", "counter", "Onsets handed to the beat callback"
+        )
+        self.metrics.collect("tempo_bpm", lambda: self.onsets.bpm)
+
+        logger.info(f"Block Size: {blocksize}")
+        logger.info(f"Freqs Shape: {self.freqs.shape}")
+        logger.info(f"Freqs Interval: {self.freqs[1]}")
+        logger.info(f"Freqs Max: {self.freqs[-1]}")
+        logger.info(f"Bands Layout: {band_layout}")
+        logger.info(f"Bands Freqs: {self.bands.tolist()}")
+        logger.info(f"Samples Number: {self.samples_to_average}")
+        logger.info(f"Samples Per Output: {self.samples_per_output}")
+        logger.info(f"Smoothing: {smoothing}")
+        logger.info(f"FFT Backend: {self.analyzer.fft_backend}")
+        logger.info(f"Normalize: {normalize}")
 
     def start(self):
         self.stream.start()
 
-    def __listen(self, indata: np.ndarray, frames: int, *_) -> None:
-        window = np.hanning(frames)[:, None]
-        magnitude = np.abs(np.fft.rfft(indata * window, axis=0))
+    def __listen(self, indata: np.ndarray, frames: int, time_info, status=None) -> None:
+        started = perf_counter()
 
-        low_bands = magnitude[self.bands["low"][0] : self.bands["low"][1]]
-        mid_bands = magnitude[self.bands["mid"][0] : self.bands["mid"][1]]
-        high_bands = magnitude[self.bands["high"][0] : self.bands["high"][1]]
+        if status is not None and status.input_overflow:
+            self.metrics.inc("audio_input_overflows_total")
 
-        low_band_avg = np.average(low_bands)
-        low_band_max = np.max(low_bands)
-        r = int(
-            (low_band_max if low_band_max / 2 > low_band_avg else low_band_avg) * 255
-        )
+        self.__process(indata, time_info)
 
-        mid_band_avg = np.average(mid_bands)
-        mid_band_max = np.max(mid_bands)
-        g = int(
-            (mid_band_max if mid_band_max / 2 > mid_band_avg else mid_band_avg) * 255
-        )
+        self.metrics.observe("audio_callback_seconds", perf_counter() - started)
 
-        high_band_avg = np.average(high_bands)
-        high_band_max = np.max(high_bands)
-        b = int(
-            (high_band_max if high_band_max / 2 > high_band_avg else high_band_avg)
-            * 255
+    def __process(self, indata: np.ndarray, time_info) -> None:
+        levels = self.analyzer.analyze(indata)
+
+        # Date the block by when it hit the ADC, not when we got it.
+        captured_at = monotonic()
+        if time_info is not None and time_info.currentTime > 0:
+            captured_at -= time_info.currentTime - time_info.inputBufferAdcTime
+
+        # Beats skip smoothing and decimation so accents land on the block.
+        if self.beat_callback and self.onsets.update(self.analyzer.magnitude):
+            self.beat_callback(self.onsets.write(self.__beat), captured_at)
+            self.metrics.inc("beats_published_total")
+
+        # Saturate before smoothing so loud blocks cannot drag the average
+        # past 255 and wrap in the uint8 frame.
+        scale(self.analyzer.color, 255, out=self.__sample[1:4])
+        scale(levels, 255, out=self.__sample[4:])
+        self.__sample[0] = self.__sample[1:4].max()
+
+        smoothed = self.smoother.update(self.__sample)
+        quantize(clip(smoothed, out=self.__output), out=self.__frame)
+
+        # Streaming outputs skip the decimation and take every block.
+        if self.block_callback:
+            self.block_callback(self.__frame, captured_at)
+
+        self.__samples_since_output += 1
+        if self.__samples_since_output < self.samples_per_output:
+            return
+
+        self.__samples_since_output = 0
+
+        if self.callback:
+            self.callback(self.__frame, captured_at)
+
+        self.metrics.inc("frames_published_total")
+
+    def render_track(self, chunk_blocks: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+        blocksize = self.stream.blocksize
+        block_count = -(-self.audio_file.frames // blocksize)
+
+        smoother = FrameSmoother(
+            self.frame_size, self.samples_to_average, mode=self.smoother.mode
         )
+        if self.analyzer.normalizer:
+            self.analyzer.normalizer.reset()
 
-        br = clamp(0, max(r, g, b), 255)
+        samples = np.zeros((chunk_blocks, self.frame_size), dtype=np.float64)
 
-        if len(self.data) < self.samples_to_average - 1:
-            self.data.append([br, r, g, b])
-        else:
-            br, r, g, b = np.array(np.average(self.data, axis=0), dtype=np.uint8)
-            if self.callback:
-                self.callback(int(br), [int(r), int(g), int(b)])
-            self.data.clear()
+        timestamps = []
+        frames = []
+
+        for start in range(0, block_count, chunk_blocks):
+            count = min(chunk_blocks, block_count - start)
+
+            blocks = self.audio_file.read_blocks(start, count, blocksize)
+            levels, colors = self.analyzer.analyze_blocks(blocks)
+
+            chunk = samples[:count]
+            scale(colors, 255, out=chunk[:, 1:4])
+            scale(levels, 255, out=chunk[:, 4:])
+            np.max(chunk[:, 1:4], axis=1, out=chunk[:, 0])
+
+            for i in range(count):
+                smoothed = smoother.update(chunk[i])
+
+                if (start + i + 1) % self.samples_per_output == 0:
+                    timestamps.append((start + i + 1) * blocksize / self.samplerate)
+                    frames.append(
+                        quantize(
+                            clip(smoothed),
+                            out=np.empty(self.frame_size, dtype=np.uint8),
+                        )
+                    )
+
+        return (
+            np.array(timestamps, dtype=np.float64),
+            np.array(frames, dtype=np.uint8).reshape(-1, self.frame_size),
+        )
 
     def __finish(self) -> None:
         if self.finished_callback:
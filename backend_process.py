@@ -0,0 +1,382 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
+from multiprocessing.connection import Connection
+from time import monotonic, perf_counter
+from typing import Dict, List, Tuple
+
+from delta_filter import DeltaFilter
+from frame_math import brightness_curve
+from frame_ring_buffer import FrameRingBuffer
+from latency_calibration import LatencyTracker, save_calibration
+from light_mapping import LightMapping, load_light_mapping
+from onset_detector import accent_color
+from pipeline_metrics import MetricsRegistry, metrics_exporter_from_env
+from queue_logging import FrameLogSummary, setup_logging
+from send_scheduler import LatestValueScheduler
+
+logger = logging.getLogger(__name__)
+
+Stamps = Tuple[float, float, float]
+Group = Tuple[int, List[str], int, List[int]]
+
+
+class BackendProcess(multiprocessing.Process, ABC):
+    backend_name = "backend"
+    frame_timeout = 3.0
+    # Streaming backends read every analysis block rather than the decimated
+    # frames, and send each one instead of only the changes.
+    streaming = False
+
+    def __init__(
+        self,
+        process_connection: Connection,
+        frame_buffer: FrameRingBuffer,
+        hold_ms: float = 0,
+        metrics_port_offset: int = 1,
+        beat_buffer: FrameRingBuffer | None = None,
+    ) -> None:
+        super().__init__()
+
+        self.__process_connection = process_connection
+        self.frame_buffer = frame_buffer
+        self.beat_buffer = beat_buffer
+
+        # Extra delay so a fast backend lands together with slower ones.
+        self.hold = hold_ms / 1000
+        self.metrics_port_offset = metrics_port_offset
+
+        self.__running = False
+        self.__stopping = False
+        self.__created_at = monotonic()
+        self.__first_sent = False
+        self.__last_mapped = []
+
+        self.delta_filter = DeltaFilter(
+            threshold=float(os.getenv("DELTA_THRESHOLD", 3)),
+            keepalive_ms=float(os.getenv("DELTA_KEEPALIVE_MS", 1000)),
+        )
+
+        self.metrics = MetricsRegistry()
+        self.latency = LatencyTracker(metrics=self.metrics, hold=self.hold)
+        self.__calibration_path = os.getenv("LATENCY_CALIBRATION")
+        self.__device_latency_ms = float(os.getenv("DEVICE_LATENCY_MS", 0))
+        self.__frame_log = FrameLogSummary(
+            logging.getLogger(type(self).__module__),
+            float(os.getenv("LOG_FRAME_INTERVAL_MS", 1000)),
+        )
+
+    # Hooks for subclasses. _setup runs in the child process and returns the
+    # light ids plus name aliases, or None when the backend cannot start.
+    @abstractmethod
+    def _setup(self) -> Tuple[List[str], Dict[str, str]] | None: ...
+
+    @abstractmethod
+    def _submit(self, groups: List[Group], stamps: Stamps) -> None: ...
+
+    def _drain(self) -> None:
+        pass
+
+    def _teardown(self) -> None:
+        pass
+
+    def _stats(self) -> Dict[str, dict]:
+        return {}
+
+    def _record_send(self, stamps: Stamps) -> None:
+        self.metrics.inc("sends_total")
+        self.latency.record(*stamps)
+
+        if not self.__first_sent:
+            self.__first_sent = True
+            logger.info(
+                f"First Light Sent {(monotonic() - self.__created_at) * 1000:.0f} ms"
+                " After Startup"
+            )
+
+    def _record_error(self, reason: str) -> None:
+        self.metrics.inc("send_errors_total", reason=reason)
+
+    def __start_metrics(self) -> None:
+        self.metrics.describe(
+            "frame_processing_seconds", "histogram", "Time spent mapping a frame"
+        )
+        self.metrics.describe("sends_total", "counter", "Light updates sent")
+        self.metrics.describe(
+            "send_errors_total", "counter", "Light updates that failed"
+        )
+        self.metrics.collect("frames_skipped_total", lambda: self.frame_buffer.skipped)
+        self.metrics.collect("frame_backlog", lambda: self.frame_buffer.backlog)
+        self.metrics.collect("delta_filter", self.delta_filter.stats, label="stat")
+
+        for name, stats in self._stats().items():
+            self.metrics.collect(
+                name.lower().replace(" ", "_"),
+                lambda name=name: self._stats()[name],
+                label="stat",
+            )
+
+        self.__exporter = metrics_exporter_from_env(
+            self.metrics, self.backend_name, port_offset=self.metrics_port_offset
+        )
+        if self.__exporter:
+            self.__exporter.start()
+
+    def __push_states(self) -> None:
+        while self.__running:
+            try:
+                frame = self.frame_buffer.get(
+                    timeout=self.frame_timeout, delay=self.hold
+                )
+                stamps = (
+                    self.frame_buffer.captured_at,
+                    self.frame_buffer.published_at,
+                    monotonic(),
+                )
+                started = perf_counter()
+                self.metrics.inc("frames_received_total")
+
+                self.__frame_log.update(frame, self.frame_buffer.skipped)
+
+                with self.__dispatch_lock:
+                    self.__last_mapped = self.light_mapping.map(frame)
+                    self.__dispatch(self.__last_mapped, stamps)
+
+                self.metrics.observe(
+                    "frame_processing_seconds", perf_counter() - started
+                )
+            except queue.Empty:
+                logger.warning("Queue Empty")
+
+        logger.info("Queue Closed")
+
+    def __dispatch(
+        self, mapped: List[Tuple[List[str], int, List[int]]], stamps: Stamps
+    ) -> None:
+        if self.__stopping:
+            return
+
+        groups = [
+            (i, lights, group_br, group_cl)
+            for i, (lights, group_br, group_cl) in enumerate(mapped)
+            if self.streaming or self.delta_filter.should_send(i, group_br, group_cl)
+        ]
+
+        if groups:
+            self._submit(groups, stamps)
+
+    def __push_beats(self) -> None:
+        while self.__running:
+            try:
+                beat = self.beat_buffer.get(timeout=self.frame_timeout, delay=self.hold)
+            except queue.Empty:
+                continue
+
+            stamps = (
+                self.beat_buffer.captured_at,
+                self.beat_buffer.published_at,
+                monotonic(),
+            )
+            strength = int(beat[0])
+            self.metrics.inc("beats_received_total")
+
+            # Flash the last colours right away; the next frame fades them back.
+            with self.__dispatch_lock:
+                self.__dispatch(
+                    [
+                        (lights, *accent_color(br, cl, strength))
+                        for lights, br, cl in self.__last_mapped
+                    ],
+                    stamps,
+                )
+
+    def __process_connection_listener(self) -> None:
+        while True:
+            message = self.__process_connection.recv()
+
+            if message == "kill":
+                self.kill()
+                self.close()
+
+                break
+
+    def run(self) -> None:
+        self.__log_listener = setup_logging()
+
+        # Always answer main, otherwise it waits on this backend forever.
+        try:
+            lights = self._setup()
+        except Exception:
+            logger.exception(f"{self.backend_name} Setup Raised")
+            lights = None
+
+        if lights is None:
+            logger.error(f"{self.backend_name} Backend Failed To Start")
+            self.__process_connection.send("failed")
+            self.__log_listener.stop()
+
+            return
+
+        lights, aliases = lights
+        curve = os.getenv("BRIGHTNESS_CURVE", "linear")
+        self.light_mapping = LightMapping(
+            load_light_mapping(os.getenv("LIGHT_MAPPING")),
+            lights,
+            self.frame_buffer.frame_size - 4,
+            aliases=aliases,
+            curve=(
+                brightness_curve(curve, float(os.getenv("BRIGHTNESS_GAMMA", 2.2)))
+                if curve != "linear"
+                else None
+            ),
+        )
+
+        logger.debug("Lights: %s", lights)
+        logger.info(f"Light Groups: {self.light_mapping.groups}")
+
+        self.__running = True
+        # Created in the child; a lock cannot be pickled under spawn.
+        self.__dispatch_lock = threading.Lock()
+
+        threading.Thread(target=self.__process_connection_listener, daemon=True).start()
+        if self.beat_buffer:
+            threading.Thread(target=self.__push_beats, daemon=True).start()
+
+        self.__start_metrics()
+
+        self.__process_connection.send("ready")
+        self.__push_states()
+
+        # kill() ends __push_states once it has logged its teardown, so
+        # nothing is left to flush after this.
+        self.__log_listener.stop()
+
+    def kill(self) -> None:
+        # Nothing may be submitted once draining starts, or a late frame
+        # could land after the teardown restores the lights.
+        with self.__dispatch_lock:
+            self.__stopping = True
+
+        self._drain()
+
+        for name, stats in self._stats().items():
+            logger.info(f"{name}: {stats}")
+        logger.info(f"Delta Filter: {self.delta_filter.stats()}")
+        logger.info(self.latency.summary_line())
+
+        if self.__calibration_path:
+            save_calibration(
+                self.__calibration_path,
+                self.backend_name,
+                self.latency,
+                self.__device_latency_ms,
+            )
+
+        if self.__exporter:
+            self.__exporter.close()
+
+        self._teardown()
+
+        logger.info(f"{self.backend_name} Process Killed")
+        self.__running = False
+
+
+class AsyncBackendProcess(BackendProcess):
+    max_in_flight = 1
+    send_deadline: float | None = None
+    # Schedule each light on its own slot so one slow device cannot hold
+    # back the rest of its group.
+    per_light = False
+
+    # Async hooks, all run on the backend's event loop thread.
+    @abstractmethod
+    async def _connect(self) -> bool: ...
+
+    @abstractmethod
+    async def _fetch_lights(self) -> Tuple[List[str], Dict[str, str]]: ...
+
+    @abstractmethod
+    async def _send(
+        self, lights: List[str], brightness: int, rgb_color: List[int]
+    ) -> bool: ...
+
+    async def _recover(self) -> None:
+        pass
+
+    async def _close(self) -> None:
+        pass
+
+    def __initialize_loop(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.__loop_runner, daemon=True).start()
+
+    def __loop_runner(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run_coroutine(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def __send(
+        self,
+        group: int,
+        lights: List[str],
+        brightness: int,
+        rgb_color: List[int],
+        stamps: Stamps,
+    ) -> bool:
+        sent = await self._send(lights, brightness, rgb_color)
+
+        if sent:
+            self._record_send(stamps)
+
+        return sent
+
+    def __resend(self, group: int, *_) -> None:
+        # The delta filter counted this value as sent when it was submitted;
+        # forget it so the next frame goes out even if it barely changed.
+        self.delta_filter.invalidate(group)
+
+    def __submit_groups(self, groups: List[Group], stamps: Stamps) -> None:
+        for i, lights, br, cl in groups:
+            if self.per_light:
+                for light in lights:
+                    self.__scheduler.submit(light, i, [light], br, cl, stamps)
+            else:
+                self.__scheduler.submit(i, i, lights, br, cl, stamps)
+
+    def _setup(self) -> Tuple[List[str], Dict[str, str]] | None:
+        self.__initialize_loop()
+
+        if not self.run_coroutine(self._connect()):
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+            return None
+
+        self.__scheduler = LatestValueScheduler(
+            self.__send,
+            max_in_flight=self.max_in_flight,
+            deadline=self.send_deadline,
+            on_drop=self.__resend,
+        )
+
+        return self.run_coroutine(self._fetch_lights())
+
+    def _submit(self, groups: List[Group], stamps: Stamps) -> None:
+        self.loop.call_soon_threadsafe(self.__submit_groups, groups, stamps)
+
+    def _drain(self) -> None:
+        self.run_coroutine(self.__scheduler.drain())
+
+    def _stats(self) -> Dict[str, dict]:
+        return {"Scheduler": self.__scheduler.stats()}
+
+    def _teardown(self) -> None:
+        self.run_coroutine(self._recover())
+        self.run_coroutine(self._close())
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
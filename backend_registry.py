@@ -0,0 +1,38 @@
+from importlib import import_module
+from importlib.metadata import entry_points
+from typing import Dict
+
+ENTRY_POINT_GROUP = "vibe_lights.backends"
+
+# Imported on demand so picking one backend never pulls in another's
+# dependencies (tinytuya, websockets, httpx).
+BUILTIN_BACKENDS = {
+    "restapi": "home_assistant_rest_api_process:HomeAssistantRestAPIProcess",
+    "websocket": "home_assistant_websocket_process:HomeAssistantWebSocketProcess",
+    "local_tuya": "local_tuya_process:LocalTuyaProcess",
+    "ddp": "udp_stream_process:DDPStreamProcess",
+    "e131": "udp_stream_process:E131StreamProcess",
+    "artnet": "udp_stream_process:ArtNetStreamProcess",
+}
+
+
+def available_backends() -> Dict[str, str]:
+    backends = dict(BUILTIN_BACKENDS)
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        backends[entry_point.name] = entry_point.value
+
+    return backends
+
+
+def load_backend(name: str) -> type:
+    backends = available_backends()
+
+    if name not in backends:
+        raise KeyError(
+            f"Unknown backend {name!r}, expected one of {', '.join(backends)}"
+        )
+
+    module_name, _, class_name = backends[name].partition(":")
+
+    return getattr(import_module(module_name), class_name)
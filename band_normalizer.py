@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+
+
+class BandNormalizer:
+    def __init__(
+        self,
+        size: int,
+        samplerate: int,
+        blocksize: int,
+        decay_ms: float = 5000,
+        range_db: float = 24,
+        gate_db: float = -70,
+    ) -> None:
+        self.range_db = range_db
+        self.gate_db = gate_db
+
+        # A full scale sine through a Hann window peaks at blocksize / 4, so
+        # levels come out in dBFS whatever the block size.
+        self.__reference = 4 / blocksize
+        self.__release = 1 - math.exp(-blocksize / samplerate / (decay_ms / 1000))
+
+        self.high = np.full(size, gate_db, dtype=np.float64)
+        self.low = np.full(size, gate_db, dtype=np.float64)
+
+        self.__db = np.empty(size, dtype=np.float64)
+        self.__delta = np.empty(size, dtype=np.float64)
+        self.__step = np.empty(size, dtype=np.float64)
+        self.__floor = np.empty(size, dtype=np.float64)
+        self.__mask = np.empty(size, dtype=bool)
+        self.__primed = False
+
+    def reset(self) -> None:
+        # The next block seeds both trackers again.
+        self.__primed = False
+
+    def __follow(self, tracker: np.ndarray, rising: bool) -> None:
+        # Jump straight to a new extreme, decay back towards the signal.
+        np.subtract(self.__db, tracker, out=self.__delta)
+        np.multiply(self.__delta, self.__release, out=self.__step)
+        if rising:
+            np.greater(self.__delta, 0, out=self.__mask)
+        else:
+            np.less(self.__delta, 0, out=self.__mask)
+        np.copyto(self.__step, self.__delta, where=self.__mask)
+        np.add(tracker, self.__step, out=tracker)
+
+    def apply(self, levels: np.ndarray) -> np.ndarray:
+        np.multiply(levels, self.__reference, out=self.__db)
+        np.maximum(self.__db, 1e-12, out=self.__db)
+        np.log10(self.__db, out=self.__db)
+        np.multiply(self.__db, 20, out=self.__db)
+
+        if not self.__primed:
+            np.maximum(self.__db, self.gate_db, out=self.high)
+            np.copyto(self.low, self.high)
+            self.__primed = True
+
+        self.__follow(self.high, rising=True)
+        self.__follow(self.low, rising=False)
+
+        np.subtract(self.high, self.range_db, out=self.__floor)
+        np.minimum(self.__floor, self.low, out=self.__floor)
+
+        np.subtract(self.__db, self.__floor, out=levels)
+        np.subtract(self.high, self.__floor, out=self.__delta)
+        np.divide(levels, self.__delta, out=levels)
+        np.clip(levels, 0, 1, out=levels)
+
+        np.less(self.__db, self.gate_db, out=self.__mask)
+        np.copyto(levels, 0, where=self.__mask)
+
+        return levels
@@ -0,0 +1,474 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+import wave
+from functools import lru_cache
+from typing import Callable
+
+import numpy as np
+
+from band_normalizer import BandNormalizer
+from frame_math import brightness_curve, color_hsv, quantize, rgb_to_hsv, scale
+from frame_smoother import SMOOTHING_MODES, FrameSmoother
+from onset_detector import OnsetDetector
+from pipeline_metrics import MetricsRegistry
+from queue_logging import FrameLogSummary, setup_logging
+from spectrum_analyzer import SpectrumAnalyzer, build_bands
+
+SAMPLERATE = 48000
+BLOCKSIZE = 1024
+CHANNELS = 2
+BANDS = [(20, 250), (250, 4000), (4000, 12000)]
+
+
+def legacy_listen(indata: np.ndarray, frames: int, bands: dict) -> None:
+    window = np.hanning(frames)[:, None]
+    magnitude = np.abs(np.fft.rfft(indata * window, axis=0))
+
+    for li, ri in bands.values():
+        band = magnitude[li:ri]
+        band_avg = np.average(band)
+        band_max = np.max(band)
+        int((band_max if band_max / 2 > band_avg else band_avg) * 255)
+
+
+def measure(name: str, fn: Callable[[], None], number: int) -> None:
+    fn()
+
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(100):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, call_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, call_peak - baseline)
+    tracemalloc.stop()
+
+    print(
+        f"{name:<24} {seconds * 1e6:>9.1f} us/call {peak / 1024:>9.1f} KiB allocated/call"
+    )
+
+
+def bench_fft(number: int) -> None:
+    rng = np.random.default_rng(0)
+    indata = rng.uniform(-1, 1, (BLOCKSIZE, CHANNELS)).astype(np.float32)
+
+    bands = dict(
+        zip(
+            ("low", "mid", "high"),
+            SpectrumAnalyzer(SAMPLERATE, BLOCKSIZE, CHANNELS, BANDS).bands,
+        )
+    )
+
+    print(f"Block Size: {BLOCKSIZE}, Channels: {CHANNELS}, Samplerate: {SAMPLERATE}")
+
+    measure("legacy __listen", lambda: legacy_listen(indata, BLOCKSIZE, bands), number)
+
+    for fft_backend in ("numpy", "scipy"):
+        analyzer = SpectrumAnalyzer(
+            SAMPLERATE, BLOCKSIZE, CHANNELS, BANDS, fft_backend=fft_backend
+        )
+        if analyzer.fft_backend == fft_backend:
+            measure(
+                f"SpectrumAnalyzer {fft_backend}",
+                lambda: analyzer.analyze(indata),
+                number,
+            )
+
+
+def legacy_bands(indata: np.ndarray, edges: list) -> None:
+    magnitude = np.abs(np.fft.rfft(indata * np.hanning(BLOCKSIZE)[:, None], axis=0))
+
+    for li, ri in edges:
+        band = magnitude[li:ri]
+        band_avg = np.average(band)
+        band_max = np.max(band)
+        int((band_max if band_max / 2 > band_avg else band_avg) * 255)
+
+
+def bench_bands(number: int) -> None:
+    rng = np.random.default_rng(0)
+    indata = rng.uniform(-1, 1, (BLOCKSIZE, CHANNELS)).astype(np.float32)
+
+    for count in (3, 32, 64):
+        bands = build_bands("log", count) if count != 3 else build_bands("rgb")
+        analyzer = SpectrumAnalyzer(SAMPLERATE, BLOCKSIZE, CHANNELS, bands)
+        edges = analyzer.bands.tolist()
+
+        measure(
+            f"per-band loop {count} bands",
+            lambda: legacy_bands(indata, edges),
+            number,
+        )
+        measure(f"reduceat {count} bands", lambda: analyzer.analyze(indata), number)
+
+        normalized = SpectrumAnalyzer(
+            SAMPLERATE,
+            BLOCKSIZE,
+            CHANNELS,
+            bands,
+            normalizer=BandNormalizer(len(bands), SAMPLERATE, BLOCKSIZE),
+        )
+        measure(
+            f"reduceat {count} bands normalized",
+            lambda: normalized.analyze(indata),
+            number,
+        )
+
+
+def bench_smoothing(number: int) -> None:
+    window = 23
+    sample = np.random.default_rng(0).uniform(0, 255, 4 + 32)
+    data = []
+
+    def legacy_average() -> None:
+        if len(data) < window - 1:
+            data.append(list(sample))
+        else:
+            np.array(np.average(data, axis=0), dtype=np.uint8)
+            data.clear()
+
+    measure("legacy list average", legacy_average, number)
+
+    for mode in SMOOTHING_MODES:
+        smoother = FrameSmoother(sample.shape[0], window, mode=mode)
+        measure(f"FrameSmoother {mode}", lambda: smoother.update(sample), number)
+
+
+def bench_onset(number: int) -> None:
+    analyzer = SpectrumAnalyzer(SAMPLERATE, BLOCKSIZE, CHANNELS, BANDS)
+    detector = OnsetDetector(analyzer.freqs.shape[0], SAMPLERATE, BLOCKSIZE)
+    blocks = (
+        np.random.default_rng(0)
+        .uniform(-1, 1, (16, BLOCKSIZE, CHANNELS))
+        .astype(np.float32)
+    )
+    i = 0
+
+    def update() -> None:
+        nonlocal i
+        analyzer.analyze(blocks[i % 16])
+        detector.update(analyzer.magnitude)
+        i += 1
+
+    measure("analyze", lambda: analyzer.analyze(blocks[0]), number)
+    measure("analyze + onset update", update, number)
+
+
+def bench_metrics(number: int) -> None:
+    metrics = MetricsRegistry()
+
+    measure("counter inc", lambda: metrics.inc("sends_total"), number)
+    measure(
+        "labelled counter inc",
+        lambda: metrics.inc("send_errors_total", reason="timeout"),
+        number,
+    )
+    measure(
+        "histogram observe", lambda: metrics.observe("callback_seconds", 0.003), number
+    )
+
+
+def bench_logging(number: int) -> None:
+    frame = np.random.default_rng(0).integers(0, 255, 4 + 32, dtype=np.uint8)
+    listener = setup_logging("INFO")
+    logger = logging.getLogger("benchmark")
+    summary = FrameLogSummary(logger)
+
+    with open(os.devnull, "w") as devnull:
+
+        def legacy_print() -> None:
+            br, *cl = frame[:4].tolist()
+            print(
+                f"Br: {br}, R: {cl[0]}, G: {cl[1]}, B: {cl[2]}, Skipped: 0",
+                file=devnull,
+            )
+
+        measure("legacy per-frame print", legacy_print, number)
+
+    measure("FrameLogSummary update", lambda: summary.update(frame, 0), number)
+
+    listener.stop()
+
+
+def write_test_wav(path: str, seconds: float) -> None:
+    t = np.arange(int(seconds * SAMPLERATE)) / SAMPLERATE
+    tone = np.sin(2 * np.pi * 110 * t) * (t % 0.5 < 0.1) + 0.3 * np.sin(
+        2 * np.pi * 3000 * t
+    )
+    samples = (np.stack([tone, tone], axis=1) * 0.5 * 32767).astype(np.int16)
+
+    with wave.open(path, "wb") as f:
+        f.setnchannels(CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLERATE)
+        f.writeframes(samples.tobytes())
+
+
+def bench_replay(number: int) -> None:
+    from audio_input_stream_manager import AudioInputStreamManager
+
+    seconds = 60
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "replay.wav")
+        write_test_wav(path, seconds)
+
+        frames = []
+        finished = threading.Event()
+
+        audio_manager = AudioInputStreamManager()
+        audio_manager.initialize_file_source(path, realtime=False)
+        audio_manager.build_stream(
+            ms=500,
+            output_ms=50,
+            callback=lambda frame, captured_at: frames.append(frame.copy()),
+            finished_callback=finished.set,
+        )
+
+        start = timeit.default_timer()
+        audio_manager.start()
+        finished.wait()
+        streamed = timeit.default_timer() - start
+
+        start = timeit.default_timer()
+        _, track = audio_manager.render_track()
+        rendered = timeit.default_timer() - start
+
+        audio_manager.close()
+
+    print(
+        f"{'streamed replay':<24} {streamed:>9.3f} s"
+        f" {seconds / streamed:>7.0f}x realtime {len(frames)} frames"
+    )
+    print(
+        f"{'batch render_track':<24} {rendered:>9.3f} s"
+        f" {seconds / rendered:>7.0f}x realtime {len(track)} frames"
+        f" identical: {np.array_equal(np.array(frames), track)}"
+    )
+
+
+def bench_rest(number: int) -> None:
+    import httpx
+
+    from home_assistant_rest_api_process import build_client
+    from stub_home_assistant_server import StubHomeAssistantServer
+
+    async def run_client(name: str, client: httpx.AsyncClient, base_url: str) -> None:
+        data = {
+            "entity_id": ["light.stub_0"],
+            "brightness": 128,
+            "rgb_color": [1, 2, 3],
+        }
+        latencies = np.empty(number, dtype=np.float64)
+
+        async with client:
+            await client.post(f"{base_url}/services/light/turn_on", json=data)
+
+            start = timeit.default_timer()
+            for i in range(number):
+                sent = timeit.default_timer()
+                await client.post(f"{base_url}/services/light/turn_on", json=data)
+                latencies[i] = timeit.default_timer() - sent
+            elapsed = timeit.default_timer() - start
+
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(
+            f"{name:<24} {number / elapsed:>9.1f} req/s"
+            f" p50 {p50:>6.2f} ms p99 {p99:>6.2f} ms"
+        )
+
+    async def run() -> None:
+        server = StubHomeAssistantServer()
+        await server.start(port=0)
+        base_url = f"http://127.0.0.1:{server.port}/api"
+
+        await run_client("legacy AsyncClient", httpx.AsyncClient(timeout=10), base_url)
+        await run_client(
+            "no keep-alive",
+            build_client(base_url, {}, max_keepalive_connections=0),
+            base_url,
+        )
+        await run_client("tuned build_client", build_client(base_url, {}), base_url)
+
+        await server.close()
+
+    asyncio.run(run())
+
+
+def bench_udp(number: int) -> None:
+    import socket
+
+    from udp_stream_process import (
+        ArtNetPacketizer,
+        DDPPacketizer,
+        E131Packetizer,
+        PixelSpreader,
+    )
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    address = receiver.getsockname()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    color = [255, 128, 0]
+
+    for packetizer_class in (DDPPacketizer, E131Packetizer, ArtNetPacketizer):
+        packetizer = packetizer_class(300)
+
+        measure(
+            f"{packetizer_class.__name__} fill",
+            lambda: packetizer.fill(color),
+            number,
+        )
+
+        def send() -> None:
+            for packet in packetizer.fill(color):
+                sender.sendto(packet, address)
+                receiver.recv(2048)
+
+        measure(f"{packetizer_class.__name__} fill+send", send, number)
+
+    spreader = PixelSpreader(300, (0, 24), 24)
+    levels = np.random.default_rng(0).integers(0, 256, 24, dtype=np.uint8)
+    packetizer = DDPPacketizer(300)
+
+    measure(
+        "PixelSpreader spread+fill",
+        lambda: packetizer.fill_pixels(spreader.spread(levels, 255)),
+        number,
+    )
+
+    sender.close()
+    receiver.close()
+
+
+def legacy_clamp(lower, data, upper):
+    return sorted([lower, data, upper])[1]
+
+
+def bench_frame_math(number: int) -> None:
+    import colorsys
+
+    from tinytuya import BulbDevice
+
+    rng = np.random.default_rng(0)
+    levels = rng.uniform(0, 1.2, 4 + 32)
+    sample = np.empty(levels.shape[0], dtype=np.float64)
+    frame = np.empty(levels.shape[0], dtype=np.uint8)
+    colors = rng.integers(0, 256, (4096, 3))
+    color = colors[0].tolist()
+    curve = brightness_curve("gamma")
+
+    def legacy_frame() -> None:
+        frame[:] = [legacy_clamp(0, int(level * 255), 255) for level in levels]
+
+    def vector_frame() -> None:
+        quantize(scale(levels, 255, out=sample), out=frame)
+
+    measure("clamp per channel", legacy_frame, number)
+    measure("scale + quantize", vector_frame, number)
+    measure("brightness curve", lambda: np.take(curve, frame, out=frame), number)
+
+    def legacy_tuya() -> None:
+        value = BulbDevice.rgb_to_hexvalue(*color, hexformat="hsv16")
+        h, s, _ = BulbDevice.hexvalue_to_hsv(value, "hsv16")
+        BulbDevice.hsv_to_hexvalue(h, s, 0.2, "hsv16")
+
+    def tuya() -> None:
+        h, s, _ = color_hsv(color)
+        f"{int(h):04x}{int(s * 1000):04x}{200:04x}"
+
+    measure("tuya hex round-trip", legacy_tuya, number)
+    measure("tuya color_hsv", tuya, number)
+
+    measure(
+        "colorsys 4096 colors",
+        lambda: [colorsys.rgb_to_hsv(*(c / 255 for c in rgb)) for rgb in colors],
+        number // 100,
+    )
+    measure("rgb_to_hsv 4096 colors", lambda: rgb_to_hsv(colors), number // 100)
+
+
+def bench_tuya(number: int) -> None:
+    from tinytuya import BulbDevice
+
+    from local_tuya_process import encode_colour
+    from tuya_local_client import TuyaCipher, TuyaConnection, encode_json
+
+    device_id = "bf0123456789abcdefgh"
+    colors = np.random.default_rng(0).integers(0, 256, (64, 3)).tolist()
+    cached = lru_cache(maxsize=4096)(encode_colour)
+    i = 0
+
+    for version in (3.3, 3.4, 3.5):
+        connection = TuyaConnection(device_id, "127.0.0.1", "0123456789abcdef", version)
+        cipher = TuyaCipher(b"0123456789abcdef", version)
+
+        def legacy() -> None:
+            nonlocal i
+            r, g, b = colors[i % 64]
+            i += 1
+            value = BulbDevice.rgb_to_hexvalue(r, g, b, hexformat="hsv16")
+            h, s, _ = BulbDevice.hexvalue_to_hsv(value, "hsv16")
+            value = BulbDevice.hsv_to_hexvalue(h, s, max(r, g, b) / 1000, "hsv16")
+            dps = {"21": "colour", "24": value}
+            message = (
+                {"protocol": 5, "t": int(time.time()), "data": {"dps": dps}}
+                if version >= 3.4
+                else {
+                    "devId": device_id,
+                    "uid": device_id,
+                    "t": str(int(time.time())),
+                    "dps": dps,
+                }
+            )
+            cipher.pack(i, 7, encode_json(message))
+
+        def lookup() -> None:
+            nonlocal i
+            r, g, b = colors[i % 64]
+            i += 1
+            cmd, message = connection.control_message(cached(max(r, g, b), r, g, b))
+            cipher.pack(i, cmd, message)
+
+        measure(f"tuya {version} hex + dumps", legacy, number)
+        measure(f"tuya {version} cached dps", lookup, number)
+
+
+BENCHMARKS = {
+    "fft": bench_fft,
+    "bands": bench_bands,
+    "smoothing": bench_smoothing,
+    "frame_math": bench_frame_math,
+    "onset": bench_onset,
+    "metrics": bench_metrics,
+    "logging": bench_logging,
+    "replay": bench_replay,
+    "rest": bench_rest,
+    "tuya": bench_tuya,
+    "udp": bench_udp,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "benchmark", choices=[*BENCHMARKS, "all"], default="all", nargs="?"
+    )
+    parser.add_argument("-n", "--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, benchmark in BENCHMARKS.items():
+        if args.benchmark in (name, "all"):
+            print(f"== {name} ==")
+            benchmark(args.number)
+            print()
@@ -0,0 +1,90 @@
+import argparse
+import os
+import tomllib
+from typing import Dict, List
+
+# CLI flags that map straight onto an environment variable.
+CLI_OPTIONS = {
+    "backend": "BACKEND",
+    "device": "AUDIO_DEVICE",
+    "channels": "AUDIO_CHANNELS",
+    "blocksize": "BLOCKSIZE",
+    "latency": "AUDIO_LATENCY",
+    "light_mapping": "LIGHT_MAPPING",
+}
+
+
+def config_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, list):
+        return ",".join(map(config_value, value))
+
+    return str(value)
+
+
+def flatten_config(config: dict, prefix: str = "") -> Dict[str, str]:
+    # Tables nest into underscore separated names, so [tuya] max_in_flight
+    # becomes TUYA_MAX_IN_FLIGHT like every other setting.
+    values = {}
+
+    for key, value in config.items():
+        name = f"{prefix}{key}".upper()
+
+        if isinstance(value, dict):
+            values.update(flatten_config(value, f"{name}_"))
+        else:
+            values[name] = config_value(value)
+
+    return values
+
+
+def load_config(path: str | None) -> Dict[str, str]:
+    if not path:
+        return {}
+
+    with open(path, "rb") as f:
+        return flatten_config(tomllib.load(f))
+
+
+def apply_config(values: Dict[str, str], override: bool = False) -> None:
+    for name, value in values.items():
+        if override or name not in os.environ:
+            os.environ[name] = value
+
+
+def parse_args(args: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--config", default=os.getenv("CONFIG"), help="TOML config file"
+    )
+    parser.add_argument("--backend", help="Comma separated backend names")
+    parser.add_argument("--device", help="Input device index, name or pattern")
+    parser.add_argument("--channels", type=int)
+    parser.add_argument("--blocksize", type=int)
+    parser.add_argument("--latency", help="low, high or seconds")
+    parser.add_argument("--light-mapping")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Set any other option, e.g. --set TUYA_MAX_IN_FLIGHT=2",
+    )
+    parser.add_argument("--list-devices", action="store_true")
+
+    return parser.parse_args(args)
+
+
+def cli_overrides(args: argparse.Namespace) -> Dict[str, str]:
+    values = {
+        name: config_value(getattr(args, option))
+        for option, name in CLI_OPTIONS.items()
+        if getattr(args, option) is not None
+    }
+
+    for assignment in args.set:
+        name, _, value = assignment.partition("=")
+        values[name.strip().upper()] = value
+
+    return values
@@ -0,0 +1,69 @@
+from math import sqrt
+from time import monotonic
+from typing import Dict, Hashable, List, Tuple
+
+
+def color_distance(a: Tuple[int, List[int]], b: Tuple[int, List[int]]) -> float:
+    (br_a, (r_a, g_a, b_a)), (br_b, (r_b, g_b, b_b)) = a, b
+
+    # Compare what the bulb actually emits: colour scaled by brightness.
+    scale_a, scale_b = br_a / 255, br_b / 255
+    dr = r_a * scale_a - r_b * scale_b
+    dg = g_a * scale_a - g_b * scale_b
+    db = b_a * scale_a - b_b * scale_b
+
+    # "Redmean" weighted RGB distance, normalised to the 0-255 range.
+    rmean = (r_a * scale_a + r_b * scale_b) / 2
+    return (
+        sqrt(
+            (2 + rmean / 256) * dr * dr
+            + 4 * dg * dg
+            + (2 + (255 - rmean) / 256) * db * db
+        )
+        / 3
+    )
+
+
+class DeltaFilter:
+    def __init__(self, threshold: float = 3, keepalive_ms: float = 1000) -> None:
+        self.threshold = threshold
+        self.keepalive = keepalive_ms / 1000
+
+        self.__last_sent: Dict[Hashable, Tuple[Tuple[int, List[int]], float]] = {}
+
+        self.total = 0
+        self.suppressed = 0
+
+    def should_send(self, key: Hashable, brightness: int, rgb_color: List[int]) -> bool:
+        self.total += 1
+
+        now = monotonic()
+        state = (brightness, rgb_color)
+        last = self.__last_sent.get(key)
+
+        if (
+            last is not None
+            and now - last[1] < self.keepalive
+            and color_distance(state, last[0]) < self.threshold
+        ):
+            self.suppressed += 1
+
+            return False
+
+        self.__last_sent[key] = (state, now)
+
+        return True
+
+    def invalidate(self, key: Hashable) -> None:
+        self.__last_sent.pop(key, None)
+
+    @property
+    def suppressed_percentage(self) -> float:
+        return 100 * self.suppressed / self.total if self.total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "total": self.total,
+            "suppressed": self.suppressed,
+            "suppressed_percentage": round(self.suppressed_percentage, 1),
+        }
@@ -0,0 +1,97 @@
+import colorsys
+from typing import List, Tuple
+
+import numpy as np
+
+BRIGHTNESS_CURVES = ("linear", "gamma", "log")
+
+
+def clip(
+    values: np.ndarray, out: np.ndarray | None = None, upper: float = 255
+) -> np.ndarray:
+    # Two ufunc calls cost less than the np.clip wrapper on frame-sized arrays.
+    out = np.maximum(values, 0, out=out)
+
+    return np.minimum(out, upper, out=out)
+
+
+def scale(
+    values: np.ndarray, factor: float, out: np.ndarray, upper: float = 255
+) -> np.ndarray:
+    np.multiply(values, factor, out=out)
+
+    return clip(out, out=out, upper=upper)
+
+
+def quantize(values: np.ndarray, out: np.ndarray) -> np.ndarray:
+    # Truncates towards zero, so clip first.
+    np.copyto(out, values, casting="unsafe")
+
+    return out
+
+
+def color_hsv(rgb_color: List[int]) -> Tuple[float, float, float]:
+    # One colour is cheaper through colorsys than through numpy.
+    h, s, v = colorsys.rgb_to_hsv(
+        rgb_color[0] / 255, rgb_color[1] / 255, rgb_color[2] / 255
+    )
+
+    return h * 360, s, v
+
+
+def rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    rgb = np.asarray(rgb, dtype=np.float64)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    high = rgb.max(axis=-1)
+    chroma = high - rgb.min(axis=-1)
+    divisor = np.where(chroma > 0, chroma, 1)
+
+    hue = np.select(
+        [high == r, high == g],
+        [(g - b) / divisor % 6, (b - r) / divisor + 2],
+        (r - g) / divisor + 4,
+    )
+
+    hsv = np.empty(rgb.shape, dtype=np.float64)
+    np.multiply(hue, 60, out=hsv[..., 0])
+    np.copyto(hsv[..., 0], 0, where=chroma == 0)
+    np.divide(chroma, np.where(high > 0, high, 1), out=hsv[..., 1])
+    np.divide(high, 255, out=hsv[..., 2])
+
+    return hsv
+
+
+def hsv_to_rgb(hsv: np.ndarray) -> np.ndarray:
+    hsv = np.asarray(hsv, dtype=np.float64)
+    h = hsv[..., 0] / 60 % 6
+    s = hsv[..., 1]
+    v = hsv[..., 2] * 255
+
+    sector = h.astype(np.intp)
+    f = h - sector
+    p = v * (1 - s)
+    q = v * (1 - s * f)
+    t = v * (1 - s * (1 - f))
+
+    rgb = np.empty(hsv.shape, dtype=np.float64)
+    rgb[..., 0] = np.choose(sector, [v, q, p, p, t, v])
+    rgb[..., 1] = np.choose(sector, [t, v, v, q, p, p])
+    rgb[..., 2] = np.choose(sector, [p, p, t, v, v, q])
+
+    return rgb
+
+
+def brightness_curve(name: str = "linear", gamma: float = 2.2) -> np.ndarray:
+    levels = np.arange(256, dtype=np.float64) / 255
+
+    if name == "linear":
+        curve = levels
+    elif name == "gamma":
+        curve = levels**gamma
+    elif name == "log":
+        curve = np.log10(1 + 9 * levels)
+    else:
+        raise ValueError(f"Unknown brightness curve: {name}")
+
+    return quantize(np.rint(curve * 255), out=np.empty(256, dtype=np.uint8))
@@ -0,0 +1,155 @@
+import queue
+from multiprocessing import shared_memory
+from time import monotonic, sleep
+
+import numpy as np
+
+HEADER_SIZE = 64
+
+
+class FrameRingBuffer:
+    def __init__(
+        self,
+        frame_size: int,
+        slots: int = 8,
+        name: str | None = None,
+        poll_interval: float = 0.001,
+    ) -> None:
+        self.frame_size = frame_size
+        self.slots = slots
+        self.poll_interval = poll_interval
+
+        size = HEADER_SIZE + slots * 8 + slots * 16 + slots * frame_size
+
+        if name is None:
+            self.__shm = shared_memory.SharedMemory(create=True, size=size)
+            self.__owner = True
+        else:
+            self.__shm = shared_memory.SharedMemory(name=name, track=False)
+            self.__owner = False
+
+        self.__map_views()
+
+        if self.__owner:
+            self.__head[0] = 0
+            self.__seqs[:] = 0
+
+    def __map_views(self) -> None:
+        buffer = self.__shm.buf
+
+        self.__head = np.ndarray((1,), dtype=np.uint64, buffer=buffer, offset=0)
+        self.__seqs = np.ndarray(
+            (self.slots,), dtype=np.uint64, buffer=buffer, offset=HEADER_SIZE
+        )
+        # Capture and publish times (time.monotonic) travel with each frame.
+        self.__stamps = np.ndarray(
+            (self.slots, 2),
+            dtype=np.float64,
+            buffer=buffer,
+            offset=HEADER_SIZE + self.slots * 8,
+        )
+        self.__frames = np.ndarray(
+            (self.slots, self.frame_size),
+            dtype=np.uint8,
+            buffer=buffer,
+            offset=HEADER_SIZE + self.slots * 24,
+        )
+
+        self.__write_seq = int(self.__head[0])
+        self.__read_seq = self.__write_seq
+        self.__out = np.zeros(self.frame_size, dtype=np.uint8)
+
+        self.captured_at = 0.0
+        self.published_at = 0.0
+
+        self.received = 0
+        self.skipped = 0
+
+    @property
+    def name(self) -> str:
+        return self.__shm.name
+
+    @property
+    def backlog(self) -> int:
+        return int(self.__head[0]) - self.__read_seq
+
+    def __getstate__(self) -> dict:
+        return {
+            "frame_size": self.frame_size,
+            "slots": self.slots,
+            "name": self.name,
+            "poll_interval": self.poll_interval,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def put(self, frame: np.ndarray, captured_at: float | None = None) -> None:
+        seq = self.__write_seq + 1
+        slot = seq % self.slots
+        now = monotonic()
+
+        self.__seqs[slot] = 0
+        self.__frames[slot] = frame
+        self.__stamps[slot] = now if captured_at is None else captured_at, now
+        self.__seqs[slot] = seq
+        self.__head[0] = seq
+
+        self.__write_seq = seq
+
+    def get_nowait(self, delay: float = 0) -> np.ndarray:
+        while True:
+            seq = int(self.__head[0])
+
+            if delay:
+                # Hold frames back: take the newest one captured at least
+                # `delay` ago that is still in the ring.
+                due = monotonic() - delay
+                oldest = max(self.__read_seq, seq - self.slots + 1)
+
+                while seq > oldest and self.__stamps[seq % self.slots, 0] > due:
+                    seq -= 1
+
+            if seq <= self.__read_seq:
+                raise queue.Empty
+
+            slot = seq % self.slots
+
+            if int(self.__seqs[slot]) != seq:
+                continue
+
+            self.__out[:] = self.__frames[slot]
+            captured_at, published_at = self.__stamps[slot].tolist()
+
+            if int(self.__seqs[slot]) == seq:
+                if delay and captured_at > due:
+                    raise queue.Empty
+
+                break
+
+        self.skipped += seq - self.__read_seq - 1
+        self.received += 1
+        self.__read_seq = seq
+        self.captured_at = captured_at
+        self.published_at = published_at
+
+        return self.__out
+
+    def get(self, timeout: float | None = None, delay: float = 0) -> np.ndarray:
+        deadline = None if timeout is None else monotonic() + timeout
+
+        while True:
+            try:
+                return self.get_nowait(delay)
+            except queue.Empty:
+                if deadline is not None and monotonic() >= deadline:
+                    raise
+
+            sleep(self.poll_interval)
+
+    def close(self) -> None:
+        del self.__head, self.__seqs, self.__stamps, self.__frames
+        self.__shm.close()
+
+        if self.__owner:
+            self.__shm.unlink()
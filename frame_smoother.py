@@ -0,0 +1,52 @@
+import numpy as np
+
+SMOOTHING_MODES = ("mean", "ema", "peak")
+
+
+class FrameSmoother:
+    def __init__(self, size: int, window: int, mode: str = "mean") -> None:
+        if mode not in SMOOTHING_MODES:
+            raise ValueError(f"Unknown smoothing mode: {mode}")
+
+        self.size = size
+        self.window = max(window, 1)
+        self.mode = mode
+
+        self.value = np.zeros(size, dtype=np.float64)
+
+        self.__history = np.zeros((self.window, size), dtype=np.float64)
+        self.__sum = np.zeros(size, dtype=np.float64)
+        self.__delta = np.zeros(size, dtype=np.float64)
+        self.__index = 0
+        self.__count = 0
+
+        self.__alpha = 2 / (self.window + 1)
+        self.__decay = 0.5 ** (1 / self.window)
+
+    def update(self, sample: np.ndarray) -> np.ndarray:
+        if self.mode == "mean":
+            slot = self.__history[self.__index]
+
+            np.subtract(self.__sum, slot, out=self.__sum)
+            np.copyto(slot, sample)
+            np.add(self.__sum, slot, out=self.__sum)
+
+            self.__index = (self.__index + 1) % self.window
+            self.__count = min(self.__count + 1, self.window)
+
+            # Re-sum once per lap so float error never accumulates.
+            if self.__index == 0:
+                np.sum(self.__history, axis=0, out=self.__sum)
+
+            np.multiply(self.__sum, 1 / self.__count, out=self.value)
+
+        elif self.mode == "ema":
+            np.subtract(sample, self.value, out=self.__delta)
+            np.multiply(self.__delta, self.__alpha, out=self.__delta)
+            np.add(self.value, self.__delta, out=self.value)
+
+        else:
+            np.multiply(self.value, self.__decay, out=self.value)
+            np.maximum(self.value, sample, out=self.value)
+
+        return self.value
@@ -1,88 +1,152 @@
 import asyncio
-import multiprocessing
+import logging
 import os
-import queue
-import threading
+from collections import Counter
 from multiprocessing.connection import Connection
-from typing import List
+from typing import Dict, List, Tuple
 
 import httpx
 
+from backend_process import AsyncBackendProcess
+from frame_ring_buffer import FrameRingBuffer
+from home_assistant_states import filter_light_states, store_initial_light_states
+
+logger = logging.getLogger(__name__)
+
+
+def build_client(
+    base_url: str,
+    headers: dict,
+    max_connections: int = 4,
+    max_keepalive_connections: int = 4,
+    keepalive_expiry_ms: float = 30000,
+    connect_timeout_ms: float = 1000,
+    read_timeout_ms: float = 500,
+    write_timeout_ms: float = 250,
+    pool_timeout_ms: float = 100,
+) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry_ms / 1000,
+    )
+    timeout = httpx.Timeout(
+        connect=connect_timeout_ms / 1000,
+        read=read_timeout_ms / 1000,
+        write=write_timeout_ms / 1000,
+        pool=pool_timeout_ms / 1000,
+    )
+
+    return httpx.AsyncClient(
+        base_url=base_url, headers=headers, limits=limits, timeout=timeout
+    )
+
+
+class HomeAssistantRestAPIProcess(AsyncBackendProcess):
+    backend_name = "restapi"
+    frame_timeout = 5.0
 
-class HomeAssistantRestAPIProcess(multiprocessing.Process):
     def __init__(
-        self, process_connection: Connection, process_queue: multiprocessing.Queue
+        self,
+        process_connection: Connection,
+        frame_buffer: FrameRingBuffer,
+        **options,
     ) -> None:
-        super().__init__()
+        super().__init__(process_connection, frame_buffer, **options)
 
-        self.__process_connection = process_connection
-        self.__process_queue = process_queue
-
-        self.__base_url = f"http://{os.getenv("HOMEASSISTANT_SERVER_IP")}:{os.getenv("HOMEASSISTANT_SERVER_PORT")}/api"
+        self.__base_url = f"{os.getenv("HOMEASSISTANT_SCHEME", "http")}://{os.getenv("HOMEASSISTANT_SERVER_IP")}:{os.getenv("HOMEASSISTANT_SERVER_PORT")}/api"
         self.__headers = {
             "Authorization": f"Bearer {os.getenv("HOMEASSISTANT_API_KEY")}",
             "content-type": "application/json",
         }
 
-        self.__connection_status = False
+        self.max_in_flight = int(os.getenv("HOMEASSISTANT_MAX_IN_FLIGHT", 1))
+
+        self.__client_options = {
+            "max_connections": int(os.getenv("HOMEASSISTANT_MAX_CONNECTIONS", 4)),
+            "max_keepalive_connections": int(
+                os.getenv("HOMEASSISTANT_MAX_KEEPALIVE_CONNECTIONS", 4)
+            ),
+            "keepalive_expiry_ms": float(
+                os.getenv("HOMEASSISTANT_KEEPALIVE_EXPIRY_MS", 30000)
+            ),
+            "connect_timeout_ms": float(
+                os.getenv("HOMEASSISTANT_CONNECT_TIMEOUT_MS", 1000)
+            ),
+            "read_timeout_ms": float(os.getenv("HOMEASSISTANT_READ_TIMEOUT_MS", 500)),
+            "write_timeout_ms": float(os.getenv("HOMEASSISTANT_WRITE_TIMEOUT_MS", 250)),
+            "pool_timeout_ms": float(os.getenv("HOMEASSISTANT_POOL_TIMEOUT_MS", 100)),
+        }
+        self.__reconnect_backoff = (
+            float(os.getenv("HOMEASSISTANT_RECONNECT_BACKOFF_MS", 1000)) / 1000
+        )
 
-    def __initialize_loop(self) -> None:
-        self.__loop = asyncio.new_event_loop()
-        threading.Thread(target=self.__loop_runner, daemon=True).start()
+    async def _connect(self) -> bool:
+        self.__client_session = build_client(
+            self.__base_url, self.__headers, **self.__client_options
+        )
+        self.__reconnect_lock = asyncio.Lock()
+        self.__reconnect_after = 0.0
 
-    def __loop_runner(self) -> None:
-        asyncio.set_event_loop(self.__loop)
-        self.__loop.run_forever()
+        self.__in_flight = Counter()
+        self.__idle: Dict[httpx.AsyncClient, asyncio.Event] = {}
+        self.__retiring = set()
 
-    def __connect(self) -> None:
-        self.__client_session = httpx.AsyncClient(
-            base_url=self.__base_url,
-            headers=self.__headers,
-            timeout=10,
-        )
-        self.__connection_status = True
-
-    def __store_initial_light_states(self, states: List[dict]) -> None:
-        initial_light_states = {}
-
-        for state in states:
-            initial_light_states[state["entity_id"]] = {
-                "state": state["state"],
-                "attributes": {
-                    "effect": state["attributes"]["effect"],
-                    "color_mode": state["attributes"]["color_mode"],
-                    "brightness": state["attributes"]["brightness"],
-                    "color_temp_kelvin": state["attributes"]["color_temp_kelvin"],
-                    "color_temp": state["attributes"]["color_temp"],
-                    "hs_color": state["attributes"]["hs_color"],
-                    "rgb_color": state["attributes"]["rgb_color"],
-                    "xy_color": state["attributes"]["xy_color"],
-                    "raw_state": state["attributes"]["raw_state"],
-                    "raw_color_mode": state["attributes"]["raw_color_mode"],
-                    "raw_color": state["attributes"]["raw_color"],
-                    "raw_brightness": state["attributes"]["raw_brightness"],
-                    "raw_color_temp": state["attributes"]["raw_color_temp"],
-                },
-            }
-
-        self.__initial_light_states = initial_light_states
-
-    async def __fetch_light_states(self) -> None:
-        response = await self.__client_session.get(url="/states")
-        states = response.json()
-
-        states = list(filter(lambda x: str(x["entity_id"]).startswith("light"), states))
+        return True
+
+    async def __reconnect(self) -> None:
+        async with self.__reconnect_lock:
+            if self.loop.time() < self.__reconnect_after:
+                return
+
+            logger.info("Reconnecting")
+
+            client_session = self.__client_session
+            self.__client_session = build_client(
+                self.__base_url, self.__headers, **self.__client_options
+            )
+            self.__reconnect_after = self.loop.time() + self.__reconnect_backoff
+
+            task = asyncio.create_task(self.__close_when_idle(client_session))
+            self.__retiring.add(task)
+            task.add_done_callback(self.__retiring.discard)
+
+    async def __close_when_idle(self, client_session: httpx.AsyncClient) -> None:
+        # Other groups may still be waiting on the old client; let them finish.
+        if self.__in_flight[client_session]:
+            idle = self.__idle[client_session] = asyncio.Event()
+            await idle.wait()
+
+        del self.__in_flight[client_session]
+        await client_session.aclose()
+
+    async def __post(self, url: str, json: dict) -> httpx.Response:
+        client_session = self.__client_session
+        self.__in_flight[client_session] += 1
+
+        try:
+            return await client_session.post(url=url, json=json)
+        finally:
+            self.__in_flight[client_session] -= 1
+
+            if not self.__in_flight[client_session] and client_session in self.__idle:
+                self.__idle.pop(client_session).set()
+
+    async def _fetch_lights(self) -> Tuple[List[str], Dict[str, str]]:
+        response = await self.__client_session.get(url="/states", timeout=10)
+        states = filter_light_states(response.json())
 
         # with open("states.json", "w") as f:
         #     f.write(dumps(states))
 
-        self.__store_initial_light_states(states)
-        self.__lights = list(map(lambda x: x["entity_id"], states))
+        self.__initial_light_states = store_initial_light_states(states)
 
-        print(self.__lights, end="\n\n")
+        await self.__fetch_light_actions()
+
+        return [state["entity_id"] for state in states], {}
 
     async def __fetch_light_actions(self) -> None:
-        response = await self.__client_session.get(url="/services")
+        response = await self.__client_session.get(url="/services", timeout=10)
         actions = response.json()
 
         actions = list(filter(lambda x: x["domain"] == "light", actions))[0]
@@ -90,24 +154,30 @@ class HomeAssistantRestAPIProcess(multiprocessing.Process):
         # with open("actions.json", "w") as f:
         #     f.write(dumps({"light": actions["services"]}))
 
-    async def __send_light_state(self, brightness: int, rgb_color: List[int]) -> None:
+    async def _send(
+        self, lights: List[str], brightness: int, rgb_color: List[int]
+    ) -> bool:
         data = {
-            "entity_id": self.__lights,
+            "entity_id": lights,
             "brightness": brightness,
             "rgb_color": rgb_color,
         }
 
         try:
-            await self.__client_session.post(
-                url="/services/light/turn_on",
-                json=data,
-            )
+            await self.__post(url="/services/light/turn_on", json=data)
         except httpx.TimeoutException:
-            print("Timeout")
-        except httpx.RemoteProtocolError:
-            print("RemoteProtocolError")
-
-    async def __recover_light_state(self) -> None:
+            logger.warning("Timeout")
+            self._record_error("timeout")
+            return False
+        except httpx.TransportError as e:
+            logger.warning(type(e).__name__)
+            self._record_error(type(e).__name__)
+            await self.__reconnect()
+            return False
+
+        return True
+
+    async def _recover(self) -> None:
         messages = []
 
         for light, state in self.__initial_light_states.items():
@@ -120,6 +190,7 @@ class HomeAssistantRestAPIProcess(multiprocessing.Process):
                     self.__client_session.post(
                         url="/services/light/turn_off",
                         json=data,
+                        timeout=10,
                     )
                 )
 
@@ -132,70 +203,19 @@ class HomeAssistantRestAPIProcess(multiprocessing.Process):
                     self.__client_session.post(
                         url="/services/light/turn_on",
                         json=data,
+                        timeout=10,
                     )
                 )
 
         try:
             await asyncio.gather(*messages)
         except httpx.TimeoutException:
-            print("Timeout")
+            logger.warning("Timeout")
         except httpx.RemoteProtocolError:
-            print("RemoteProtocolError")
+            logger.warning("RemoteProtocolError")
 
-        print("Initial State Restored")
+        logger.info("Initial State Restored")
 
-    def __push_states(self) -> None:
-        while True:
-            try:
-                br, cl = self.__process_queue.get(timeout=5)
-                print(f"Br: {br}, R: {cl[0]}, G: {cl[1]}, B: {cl[2]}")
-
-                self.__loop.call_soon_threadsafe(
-                    asyncio.create_task, self.__send_light_state(br, cl)
-                )
-            except queue.Empty:
-                print("Queue Empty")
-            finally:
-                if not self.__connection_status:
-                    print("Queue Closed")
-                    break
-
-    async def __close_connection(self) -> None:
+    async def _close(self) -> None:
+        await asyncio.gather(*self.__retiring)
         await self.__client_session.aclose()
-        self.__connection_status = False
-
-    def __process_connection_listener(self):
-        while True:
-            message = self.__process_connection.recv()
-
-            if message == "kill":
-                self.kill()
-                self.close()
-
-    def run(self) -> None:
-        self.__initialize_loop()
-
-        self.__connect()
-
-        asyncio.run_coroutine_threadsafe(
-            self.__fetch_light_states(), self.__loop
-        ).result()
-        asyncio.run_coroutine_threadsafe(
-            self.__fetch_light_actions(), self.__loop
-        ).result()
-
-        threading.Thread(target=self.__process_connection_listener, daemon=True).start()
-
-        self.__push_states()
-
-    def kill(self) -> None:
-        asyncio.run_coroutine_threadsafe(
-            self.__recover_light_state(), self.__loop
-        ).result()
-        asyncio.run_coroutine_threadsafe(
-            self.__close_connection(), self.__loop
-        ).result()
-
-        self.__loop.stop()
-
-        print("Rest API Process Killed")
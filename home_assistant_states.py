@@ -0,0 +1,33 @@
+from typing import Dict, List
+
+INITIAL_STATE_ATTRIBUTES = (
+    "effect",
+    "color_mode",
+    "brightness",
+    "color_temp_kelvin",
+    "color_temp",
+    "hs_color",
+    "rgb_color",
+    "xy_color",
+    "raw_state",
+    "raw_color_mode",
+    "raw_color",
+    "raw_brightness",
+    "raw_color_temp",
+)
+
+
+def filter_light_states(states: List[dict]) -> List[dict]:
+    return [state for state in states if str(state["entity_id"]).startswith("light")]
+
+
+def store_initial_light_states(states: List[dict]) -> Dict[str, dict]:
+    return {
+        state["entity_id"]: {
+            "state": state["state"],
+            "attributes": {
+                key: state["attributes"][key] for key in INITIAL_STATE_ATTRIBUTES
+            },
+        }
+        for state in states
+    }
@@ -1,51 +1,63 @@
 import asyncio
-import multiprocessing
+import logging
 import os
-import queue
-import threading
+import statistics
+from collections import deque
 from json import dumps, loads
 from multiprocessing.connection import Connection
-from typing import List
+from typing import Dict, List, Tuple
 
 import websockets
 
+from backend_process import AsyncBackendProcess
+from frame_ring_buffer import FrameRingBuffer
+from home_assistant_states import filter_light_states, store_initial_light_states
+
+logger = logging.getLogger(__name__)
+
+
+class HomeAssistantWebSocketProcess(AsyncBackendProcess):
+    backend_name = "websocket"
 
-class HomeAssistantWebSocketProcess(multiprocessing.Process):
     def __init__(
-        self, process_con: Connection, process_queue: multiprocessing.Queue
+        self, process_con: Connection, frame_buffer: FrameRingBuffer, **options
     ) -> None:
-        super().__init__()
-
-        self.__process_con = process_con
-        self.__process_queue = process_queue
+        super().__init__(process_con, frame_buffer, **options)
 
         self.__base_url = f"ws://{os.getenv("HOMEASSISTANT_SERVER_IP")}:{os.getenv("HOMEASSISTANT_SERVER_PORT")}/api/websocket"
         self.__api_key = os.getenv("HOMEASSISTANT_API_KEY")
 
-        self.__connection_status = False
         self.__id = 1
 
-    def __initialize_loop(self):
-        self.__loop = asyncio.new_event_loop()
-        threading.Thread(target=self.__loop_runner, daemon=True).start()
+        self.max_in_flight = int(os.getenv("HOMEASSISTANT_MAX_UNACKNOWLEDGED", 4))
+        self.__result_timeout = (
+            float(os.getenv("HOMEASSISTANT_RESULT_TIMEOUT_MS", 2000)) / 1000
+        )
+
+        self.__reconnect_backoff = (
+            float(os.getenv("HOMEASSISTANT_RECONNECT_BACKOFF_MS", 1000)) / 1000
+        )
+
+        self.__round_trips = deque(maxlen=1000)
 
-    def __loop_runner(self):
-        asyncio.set_event_loop(self.__loop)
-        self.__loop.run_forever()
+    async def _connect(self) -> bool:
+        # The scheduler caps each group; this caps the socket as a whole.
+        self.__unacknowledged = asyncio.Semaphore(self.max_in_flight)
+        self.__reconnect_lock = asyncio.Lock()
+        self.__reconnect_after = 0.0
 
-    def __is_connected(self) -> bool:
-        return self.__connection_status
+        return await self.__open()
 
-    async def __connect(self) -> None:
+    async def __open(self) -> bool:
         self.__ha_socket = await websockets.connect(self.__base_url)
+        self.__pending_results: Dict[int, Tuple[asyncio.Future, float]] = {}
 
         try:
             message = loads(await self.__ha_socket.recv())
         except Exception:
-            self.__connection_status = False
-            print("Connection Timeout")
+            logger.warning("Connection Timeout")
 
-            return
+            return False
 
         if message["type"] == "auth_required":
             await self.__ha_socket.send(
@@ -55,59 +67,57 @@ class HomeAssistantWebSocketProcess(multiprocessing.Process):
         try:
             message = loads(await self.__ha_socket.recv())
         except Exception:
-            self.__connection_status = False
-            print("Connection Timeout")
-
-            return
-
-        if message["type"] == "auth_ok":
-            self.__connection_status = True
-        elif message["type"] == "auth_invalid":
-            self.__connection_status = False
-
-    def __store_initial_light_states(self, states: List[dict]) -> None:
-        initial_light_states = {}
-
-        for state in states:
-            initial_light_states[state["entity_id"]] = {
-                "state": state["state"],
-                "attributes": {
-                    "effect": state["attributes"]["effect"],
-                    "color_mode": state["attributes"]["color_mode"],
-                    "brightness": state["attributes"]["brightness"],
-                    "color_temp_kelvin": state["attributes"]["color_temp_kelvin"],
-                    "color_temp": state["attributes"]["color_temp"],
-                    "hs_color": state["attributes"]["hs_color"],
-                    "rgb_color": state["attributes"]["rgb_color"],
-                    "xy_color": state["attributes"]["xy_color"],
-                    "raw_state": state["attributes"]["raw_state"],
-                    "raw_color_mode": state["attributes"]["raw_color_mode"],
-                    "raw_color": state["attributes"]["raw_color"],
-                    "raw_brightness": state["attributes"]["raw_brightness"],
-                    "raw_color_temp": state["attributes"]["raw_color_temp"],
-                },
-            }
-
-        self.__initial_light_states = initial_light_states
-
-        print(initial_light_states)
-
-    async def __fetch_light_states(self) -> None:
+            logger.warning("Connection Timeout")
+
+            return False
+
+        if message["type"] == "auth_invalid":
+            logger.error("Websocket: Auth Invalid")
+
+        return message["type"] == "auth_ok"
+
+    async def __reconnect(self, ha_socket) -> None:
+        async with self.__reconnect_lock:
+            if (
+                self.__ha_socket is not ha_socket
+                or self.loop.time() < self.__reconnect_after
+            ):
+                return
+
+            logger.info("Reconnecting")
+
+            self.__reconnect_after = self.loop.time() + self.__reconnect_backoff
+            self.__listener_task.cancel()
+
+            try:
+                connected = await self.__open()
+            except (OSError, TimeoutError, websockets.WebSocketException) as e:
+                logger.warning(f"Reconnect Failed: {type(e).__name__}")
+
+                return
+
+            if connected:
+                self.__listener_task = asyncio.create_task(self.__listen())
+
+    async def _fetch_lights(self) -> Tuple[List[str], Dict[str, str]]:
         await self.__ha_socket.send(dumps({"id": self.__id, "type": "get_states"}))
         self.__id += 1
 
         message = loads(await self.__ha_socket.recv())["result"]
-        states = list(
-            filter(lambda x: str(x["entity_id"]).startswith("light"), message)
-        )
+        states = filter_light_states(message)
 
         # with open("states.json", "w") as f:
         #     f.write(dumps(list(states)))
 
-        self.__store_initial_light_states(states)
-        self.__lights = list(map(lambda x: x["entity_id"], states))
+        self.__initial_light_states = store_initial_light_states(states)
+
+        logger.debug("Initial Light States: %s", self.__initial_light_states)
 
-        print(self.__lights, end="\n\n")
+        await self.__fetch_light_actions()
+
+        self.__listener_task = asyncio.create_task(self.__listen())
+
+        return [state["entity_id"] for state in states], {}
 
     async def __fetch_light_actions(self) -> None:
         await self.__ha_socket.send(dumps({"id": self.__id, "type": "get_services"}))
@@ -119,27 +129,87 @@ class HomeAssistantWebSocketProcess(multiprocessing.Process):
         # with open("actions.json", "w") as f:
         #     f.write(dumps(actions))
 
-    # async def __listen(self) -> None:
-    #     async for event in self.__ha_socket:
-    #         print(loads(event))
-
-    async def __send_light_state(self, brightness: int, rgb_color: List[int]) -> None:
-        data = dumps(
-            {
-                "id": self.__id,
-                "type": "call_service",
-                "domain": "light",
-                "service": "turn_on",
-                "service_data": {"brightness": brightness, "rgb_color": rgb_color},
-                "target": {"entity_id": self.__lights},
-                "return_response": False,
-            }
-        )
-        self.__id += 1
+    async def __listen(self) -> None:
+        # Bound to one socket, so a reconnect cannot fail the new one's calls.
+        ha_socket, pending_results = self.__ha_socket, self.__pending_results
+
+        try:
+            async for event in ha_socket:
+                message = loads(event)
+
+                if message["type"] != "result":
+                    continue
+
+                future, sent_at = pending_results.pop(message["id"], (None, None))
+                if future is None or future.done():
+                    continue
+
+                self.__round_trips.append(self.loop.time() - sent_at)
+                future.set_result(message)
+        except websockets.ConnectionClosed:
+            logger.warning("Web Socket Connection Closed")
+        finally:
+            for future, _ in pending_results.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Web Socket Closed"))
+
+            pending_results.clear()
+
+    async def _send(
+        self, lights: List[str], brightness: int, rgb_color: List[int]
+    ) -> bool:
+        async with self.__unacknowledged:
+            message_id = self.__id
+            data = dumps(
+                {
+                    "id": message_id,
+                    "type": "call_service",
+                    "domain": "light",
+                    "service": "turn_on",
+                    "service_data": {"brightness": brightness, "rgb_color": rgb_color},
+                    "target": {"entity_id": lights},
+                    "return_response": False,
+                }
+            )
+            self.__id += 1
 
-        await self.__ha_socket.send(data)
+            ha_socket, pending_results = self.__ha_socket, self.__pending_results
+            future = self.loop.create_future()
+            pending_results[message_id] = (future, self.loop.time())
 
-    async def __recover_initial_state(self) -> None:
+            try:
+                await ha_socket.send(data)
+                message = await asyncio.wait_for(future, self.__result_timeout)
+            except TimeoutError:
+                logger.warning("Timeout")
+                self._record_error("timeout")
+
+                return False
+            except (websockets.ConnectionClosed, ConnectionError):
+                logger.warning("Web Socket Connection Closed")
+                self._record_error("closed")
+                await self.__reconnect(ha_socket)
+
+                return False
+            finally:
+                pending_results.pop(message_id, None)
+
+        if not message["success"]:
+            self._record_error("rejected")
+
+        return message["success"]
+
+    def _stats(self) -> Dict[str, dict]:
+        stats = {"count": len(self.__round_trips)}
+
+        if len(self.__round_trips) >= 2:
+            quantiles = statistics.quantiles(self.__round_trips, n=100)
+            stats["p50_ms"] = round(quantiles[49] * 1000, 1)
+            stats["p99_ms"] = round(quantiles[98] * 1000, 1)
+
+        return {**super()._stats(), "Round Trips": stats}
+
+    async def _recover(self) -> None:
         messages = []
         for light, state in self.__initial_light_states.items():
             if state["state"] == "off":
@@ -175,71 +245,10 @@ class HomeAssistantWebSocketProcess(multiprocessing.Process):
 
         await asyncio.gather(*messages)
 
-        print("Initial State Restored")
-
-    def __push_states(self) -> None:
-        while True:
-            try:
-                br, cl = self.__process_queue.get(timeout=3)
-                print(f"Br: {br}, R: {cl[0]}, G: {cl[1]}, B: {cl[2]}")
+        logger.info("Initial State Restored")
 
-                self.__loop.call_soon_threadsafe(
-                    asyncio.create_task, self.__send_light_state(br, cl)
-                )
-            except queue.Empty:
-                print("Queue Empty")
-            finally:
-                if not self.__connection_status:
-                    print("Queue Closed")
-                    break
-
-    async def __close_socket(self) -> None:
+    async def _close(self) -> None:
         await self.__ha_socket.close()
-        self.__connection_status = False
-
-        print("Web Socket Closed")
-
-    def __process_connection_listener(self):
-        while True:
-            message = self.__process_con.recv()
-
-            if message == "kill":
-                self.kill()
-                self.close()
-
-                break
-
-    def run(self) -> None:
-        self.__initialize_loop()
-
-        asyncio.run_coroutine_threadsafe(self.__connect(), self.__loop).result()
-
-        if not self.__is_connected():
-            print("Websocket: Auth Invalid")
-
-            return
-
-        asyncio.run_coroutine_threadsafe(
-            self.__fetch_light_states(), self.__loop
-        ).result()
-        asyncio.run_coroutine_threadsafe(
-            self.__fetch_light_actions(), self.__loop
-        ).result()
-
-        threading.Thread(target=self.__process_connection_listener, daemon=True).start()
-
-        # self.__listener_task = self.__loop.create_task(self.__listen())
-
-        self.__push_states()
-
-    def kill(self) -> None:
-        # self.__listener_task.cancel()
-
-        asyncio.run_coroutine_threadsafe(
-            self.__recover_initial_state(), self.__loop
-        ).result()
-        asyncio.run_coroutine_threadsafe(self.__close_socket(), self.__loop).result()
-
-        self.__loop.stop()
+        self.__listener_task.cancel()
 
-        print("Web Socket Process Killed")
+        logger.info("Web Socket Closed")
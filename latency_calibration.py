@@ -0,0 +1,203 @@
+import os
+import statistics
+import threading
+from collections import deque
+from json import dumps, loads
+from time import monotonic
+from typing import Callable, Dict
+
+import numpy as np
+
+from pipeline_metrics import MetricsRegistry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LATENCY_STAGES = ("analysis", "transport", "send", "total")
+
+
+def load_calibration(path: str | None) -> Dict[str, dict]:
+    if not path or not os.path.exists(path):
+        return {}
+
+    with open(path, "r") as f:
+        return loads(f.read())
+
+
+def save_calibration(
+    path: str, backend: str, tracker: "LatencyTracker", device_latency_ms: float = 0
+) -> None:
+    summary = tracker.summary()
+    if not summary:
+        return
+
+    # Every backend saves on exit, so read and rewrite under one lock.
+    with open(path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+        f.seek(0)
+        content = f.read()
+        calibration = loads(content) if content.strip() else {}
+
+        calibration[backend] = {
+            **summary,
+            "device_ms": device_latency_ms,
+            "latency_ms": round(summary["total"]["p50"] + device_latency_ms, 1),
+        }
+
+        f.seek(0)
+        f.truncate()
+        f.write(dumps(calibration, indent=4))
+
+
+def light_offset_ms(latency_ms: float, audio_delay_ms: float = 0) -> float:
+    # Positive: lights would land early and must be held back.
+    # Negative: lights land late and need that much look-ahead.
+    return audio_delay_ms - latency_ms
+
+
+class LatencyTracker:
+    def __init__(
+        self,
+        window: int = 1000,
+        metrics: MetricsRegistry | None = None,
+        hold: float = 0,
+    ) -> None:
+        self.__samples = {stage: deque(maxlen=window) for stage in LATENCY_STAGES}
+        self.__metrics = metrics
+        self.hold = hold
+
+        if metrics:
+            metrics.describe(
+                "latency_seconds", "histogram", "Frame latency by pipeline stage"
+            )
+
+    def record(
+        self,
+        captured_at: float,
+        published_at: float,
+        received_at: float,
+        sent_at: float | None = None,
+    ) -> None:
+        sent_at = monotonic() if sent_at is None else sent_at
+
+        # A held reader only takes a frame once it is `hold` old. Timing
+        # transport from that point keeps the deliberate wait out of the
+        # calibration, which would otherwise swing the hold between runs.
+        released_at = max(published_at, captured_at + self.hold)
+        latencies = (
+            published_at - captured_at,
+            received_at - released_at,
+            sent_at - received_at,
+        )
+        latencies += (sum(latencies),)
+
+        for stage, latency in zip(LATENCY_STAGES, latencies):
+            self.__samples[stage].append(latency)
+
+            if self.__metrics:
+                self.__metrics.observe("latency_seconds", latency, stage=stage)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+
+        for stage, samples in self.__samples.items():
+            if len(samples) < 2:
+                return {}
+
+            quantiles = statistics.quantiles(samples, n=100)
+            summary[stage] = {
+                "p50": round(quantiles[49] * 1000, 1),
+                "p95": round(quantiles[94] * 1000, 1),
+            }
+
+        return summary
+
+    def summary_line(self) -> str:
+        summary = self.summary()
+
+        if not summary:
+            return "Latency: Not Enough Samples"
+
+        return "Latency: " + ", ".join(
+            f"{stage} p50 {values['p50']} ms / p95 {values['p95']} ms"
+            for stage, values in summary.items()
+        )
+
+
+class FrameDelayLine:
+    def __init__(
+        self,
+        put: Callable[[np.ndarray, float], None],
+        frame_size: int,
+        delay_ms: float,
+        capacity: int = 256,
+    ) -> None:
+        self.delay = delay_ms / 1000
+        self.capacity = capacity
+
+        self.__put = put
+        self.__frames = np.zeros((capacity, frame_size), dtype=np.uint8)
+        self.__captured_at = np.zeros(capacity, dtype=np.float64)
+        self.__head = 0
+        self.__tail = 0
+
+        self.__condition = threading.Condition()
+        self.__running = True
+
+        self.dropped = 0
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def push(self, frame: np.ndarray, captured_at: float) -> None:
+        with self.__condition:
+            if self.__tail - self.__head == self.capacity:
+                self.__head += 1
+                self.dropped += 1
+
+            slot = self.__tail % self.capacity
+            self.__frames[slot] = frame
+            self.__captured_at[slot] = captured_at
+            self.__tail += 1
+
+            self.__condition.notify()
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                while self.__head == self.__tail and self.__running:
+                    self.__condition.wait()
+
+                if not self.__running:
+                    return
+
+                slot = self.__head % self.capacity
+                captured_at = float(self.__captured_at[slot])
+
+            # push only moves the head when it overruns the line, which the
+            # slot check below catches.
+            delay = captured_at + self.delay - monotonic()
+            if delay > 0:
+                with self.__condition:
+                    self.__condition.wait_for(lambda: not self.__running, delay)
+
+            with self.__condition:
+                if not self.__running:
+                    return
+                if self.__head % self.capacity != slot:
+                    continue
+
+                # Re-date the frame so calibration only sees pipeline latency.
+                self.__put(self.__frames[slot], captured_at + self.delay)
+                self.__head += 1
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+
+        self.__thread.join()
@@ -0,0 +1,103 @@
+import logging
+from json import loads
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REGIONS = ("low", "mid", "high")
+
+
+def load_light_mapping(path: str | None) -> List[dict]:
+    if not path:
+        return []
+
+    with open(path, "r") as f:
+        return loads(f.read())
+
+
+class LightMapping:
+    def __init__(
+        self,
+        mapping: List[dict],
+        lights: List[str],
+        band_count: int,
+        aliases: Dict[str, str] | None = None,
+        curve: np.ndarray | None = None,
+    ) -> None:
+        self.band_count = band_count
+        self.curve = curve
+
+        aliases = aliases or {}
+        ranges: Dict[Tuple[int, int], List[str]] = {}
+        assigned = set()
+
+        for entry in mapping:
+            band_range = self.__band_range(entry)
+
+            for light in entry["lights"]:
+                light = aliases.get(light, light)
+
+                if light not in lights:
+                    logger.warning(f"Unknown Light In Mapping: {light}")
+                    continue
+                if light in assigned:
+                    continue
+
+                ranges.setdefault(band_range, []).append(light)
+                assigned.add(light)
+
+        unassigned = [light for light in lights if light not in assigned]
+        if unassigned:
+            ranges.setdefault((0, band_count), []).extend(unassigned)
+
+        self.groups = list(ranges.values())
+        self.band_ranges = list(ranges.keys())
+
+        indices = []
+        for start, stop in self.band_ranges:
+            thirds = start + np.arange(4) * (stop - start) // 3
+            thirds[1:3] = np.minimum(thirds[1:3], stop - 1)
+
+            for i in range(3):
+                indices.extend((thirds[i], max(thirds[i + 1], thirds[i] + 1)))
+
+        self.__indices = np.minimum(np.array(indices, dtype=np.intp), band_count)
+        self.__bands = np.zeros(band_count + 1, dtype=np.uint8)
+        self.__reduced = np.empty(len(indices), dtype=np.uint8)
+
+    def __band_range(self, entry: dict) -> Tuple[int, int]:
+        if "bands" in entry:
+            start, stop = entry["bands"]
+        elif entry.get("region", "all") in REGIONS:
+            i = REGIONS.index(entry["region"])
+            start = i * self.band_count // 3
+            stop = (i + 1) * self.band_count // 3
+        else:
+            start, stop = 0, self.band_count
+
+        start = min(max(int(start), 0), self.band_count - 1)
+        stop = min(max(int(stop), start + 1), self.band_count)
+
+        return start, stop
+
+    def map(self, frame: np.ndarray) -> List[Tuple[List[str], int, List[int]]]:
+        # Curves only ever rise, so curving the bands before the reduce gives
+        # the same colours and leaves curved levels for band_levels.
+        if self.curve is not None:
+            np.take(self.curve, frame[4:], out=self.__bands[:-1])
+        else:
+            self.__bands[:-1] = frame[4:]
+
+        np.maximum.reduceat(self.__bands, self.__indices, out=self.__reduced)
+        colors = self.__reduced[::2].reshape(-1, 3).tolist()
+
+        return [
+            (lights, max(color), color) for lights, color in zip(self.groups, colors)
+        ]
+
+    def band_levels(self, group: int) -> np.ndarray:
+        start, stop = self.band_ranges[group]
+
+        return self.__bands[start:stop]
@@ -0,0 +1,158 @@
+import argparse
+import logging
+import struct
+import threading
+from time import monotonic, sleep
+from typing import Callable, Tuple
+
+import numpy as np
+
+from frame_ring_buffer import FrameRingBuffer
+
+logger = logging.getLogger(__name__)
+
+TRACK_MAGIC = b"VLTK"
+TRACK_VERSION = 1
+TRACK_HEADER = struct.Struct("<4sHHQ")
+
+
+def save_track(path: str, timestamps: np.ndarray, frames: np.ndarray) -> None:
+    timestamps_us = np.round(np.asarray(timestamps) * 1e6).astype("<u8")
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+
+    with open(path, "wb") as f:
+        f.write(
+            TRACK_HEADER.pack(
+                TRACK_MAGIC, TRACK_VERSION, frames.shape[1], frames.shape[0]
+            )
+        )
+        f.write(timestamps_us.tobytes())
+        f.write(frames.tobytes())
+
+
+def load_track(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    with open(path, "rb") as f:
+        magic, version, frame_size, count = TRACK_HEADER.unpack(
+            f.read(TRACK_HEADER.size)
+        )
+
+    if magic != TRACK_MAGIC or version != TRACK_VERSION:
+        raise ValueError(f"{path} is not a version {TRACK_VERSION} light show track")
+
+    timestamps = np.memmap(
+        path, dtype="<u8", mode="r", offset=TRACK_HEADER.size, shape=(count,)
+    )
+    frames = np.memmap(
+        path,
+        dtype=np.uint8,
+        mode="r",
+        offset=TRACK_HEADER.size + count * 8,
+        shape=(count, frame_size),
+    )
+
+    return timestamps / 1e6, frames
+
+
+class LightShowPlayer:
+    def __init__(
+        self,
+        frame_buffer: FrameRingBuffer,
+        timestamps: np.ndarray,
+        frames: np.ndarray,
+        lead_ms: float = 0,
+        finished_callback: Callable | None = None,
+        spin_ms: float = 2,
+    ) -> None:
+        if frames.shape[1] != frame_buffer.frame_size:
+            raise ValueError(
+                f"Track frame size {frames.shape[1]} does not match"
+                f" frame buffer size {frame_buffer.frame_size}"
+            )
+
+        self.frame_buffer = frame_buffer
+        self.timestamps = timestamps
+        self.frames = frames
+        self.lead = lead_ms / 1000
+        self.spin = spin_ms / 1000
+
+        self.__finished_callback = finished_callback
+        self.__running = False
+        self.__thread = None
+
+        self.played = 0
+        self.late = 0
+        self.max_lateness = 0.0
+
+    def start(self) -> None:
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self) -> None:
+        start_time = monotonic()
+
+        for timestamp, frame in zip(self.timestamps, self.frames):
+            if not self.__running:
+                break
+
+            target = start_time + timestamp - self.lead
+
+            # Sleep coarsely, then spin for the last couple of milliseconds.
+            delay = target - monotonic() - self.spin
+            if delay > 0:
+                sleep(delay)
+            while monotonic() < target:
+                pass
+
+            lateness = monotonic() - target
+            if lateness > 0.001:
+                self.late += 1
+            self.max_lateness = max(self.max_lateness, lateness)
+
+            self.frame_buffer.put(frame)
+            self.played += 1
+
+        self.__running = False
+
+        logger.info(
+            f"Light Show Played: {self.played} Frames, Late: {self.late},"
+            f" Max Lateness: {self.max_lateness * 1000:.2f} ms"
+        )
+
+        if self.__finished_callback:
+            self.__finished_callback()
+
+    def stop(self) -> None:
+        self.__running = False
+
+        if self.__thread and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+
+def export_track(input_path: str, output_path: str) -> None:
+    from dotenv import load_dotenv
+
+    from audio_input_stream_manager import AudioInputStreamManager
+    from utils import stream_options_from_env
+
+    load_dotenv()
+
+    audio_manager = AudioInputStreamManager()
+    audio_manager.initialize_file_source(input_path, realtime=False)
+    audio_manager.build_stream(**stream_options_from_env())
+
+    timestamps, frames = audio_manager.render_track()
+    audio_manager.close()
+
+    save_track(output_path, timestamps, frames)
+
+    print(f"Exported {len(frames)} Frames To {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="Audio file to analyse")
+    parser.add_argument("output", help="Light show track to write")
+    args = parser.parse_args()
+
+    export_track(args.input, args.output)
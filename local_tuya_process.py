@@ -1,29 +1,126 @@
-import multiprocessing
+import asyncio
+import logging
 import os
-import queue
-import threading
+from functools import lru_cache
 from json import dumps, loads
 from multiprocessing.connection import Connection
-from time import sleep
-from typing import List
+from typing import Dict, List, Tuple
 
-from tinytuya import BulbDevice, scanner, wizard
+from tinytuya import scanner, wizard
 
+from backend_process import AsyncBackendProcess
+from frame_math import color_hsv
+from frame_ring_buffer import FrameRingBuffer
+from tuya_device_cache import TuyaDeviceCache
+from tuya_local_client import TuyaConnection, encode_json
+
+logger = logging.getLogger(__name__)
+
+
+def encode_colour(brightness: int, r: int, g: int, b: int) -> bytes:
+    h, s, _ = color_hsv((r, g, b))
+
+    return encode_json(
+        {"21": "colour", "24": f"{int(h):04x}{int(s * 1000):04x}{brightness:04x}"}
+    )
+
+
+class LocalTuyaProcess(AsyncBackendProcess):
+    backend_name = "local_tuya"
+    per_light = True
 
-class LocalTuyaProcess(multiprocessing.Process):
     def __init__(
-        self, process_connection: Connection, process_queue: multiprocessing.Queue
+        self,
+        process_connection: Connection,
+        frame_buffer: FrameRingBuffer,
+        **options,
     ) -> None:
-        super().__init__()
+        super().__init__(process_connection, frame_buffer, **options)
 
         scanner.SCANTIME = 30
 
-        self.__process_connection = process_connection
-        self.__process_queue = process_queue
+        self.max_in_flight = int(os.getenv("TUYA_MAX_IN_FLIGHT", 1))
+        self.send_deadline = float(os.getenv("TUYA_SEND_DEADLINE_MS", 200)) / 1000
+
+        # Frames are 8-bit, so a bounded cache of encoded DPS values covers
+        # nearly every colour a show repeats.
+        self.__color_step = int(os.getenv("TUYA_COLOR_STEP", 1))
+        self.__payload_cache_size = int(os.getenv("TUYA_PAYLOAD_CACHE", 4096))
+
+        self.__connection_options = {
+            "timeout": float(os.getenv("TUYA_CONNECT_TIMEOUT_MS", 1000)) / 1000,
+            "heartbeat_interval": float(os.getenv("TUYA_HEARTBEAT_MS", 10000)) / 1000,
+            "backoff": float(os.getenv("TUYA_RECONNECT_BACKOFF_MS", 500)) / 1000,
+            "max_backoff": float(os.getenv("TUYA_RECONNECT_MAX_BACKOFF_MS", 30000))
+            / 1000,
+        }
+
+        self.__device_cache = TuyaDeviceCache(
+            path=os.getenv("TUYA_DEVICE_CACHE", "tuya_devices.json"),
+            connect_timeout=float(os.getenv("TUYA_CONNECT_TIMEOUT_MS", 1000)) / 1000,
+            listen_time=float(os.getenv("TUYA_LISTEN_TIME_MS", 6000)) / 1000,
+        )
+
+    async def __open(self, devices: List[dict]) -> List[dict]:
+        connections = [
+            TuyaConnection(
+                device["id"],
+                device["ip_address"],
+                device["local_key"],
+                device["version"],
+                **self.__connection_options,
+            )
+            for device in devices
+        ]
+
+        connected = await asyncio.gather(
+            *(connection.connect() for connection in connections)
+        )
+
+        missing = []
+        for device, connection, ok in zip(devices, connections, connected):
+            if ok:
+                self.__devices.append(device)
+                self.__connections[device["id"]] = connection
+            else:
+                missing.append(device)
+
+        return missing
+
+    async def __initialize(self) -> None:
+        self.__devices = []
+        self.__connections = {}
+
+        devices = self.__device_cache.load()
 
-        self.__connection_status = False
+        if devices:
+            missing = await self.__open(devices)
 
-    def __initialize(self) -> None:
+            if missing:
+                relocated, missing = await asyncio.to_thread(
+                    self.__device_cache.revalidate, missing
+                )
+                missing += await self.__open(relocated)
+
+            if not missing:
+                self.__device_cache.save(self.__devices)
+
+                logger.info(f"Loaded {len(devices)} Devices From Cache")
+
+                return
+
+            logger.warning(f"Missing Devices: {[device['name'] for device in missing]}")
+
+            await self.__close_connection()
+            self.__devices = []
+            self.__connections = {}
+
+        await asyncio.to_thread(self.__scan_devices)
+        self.__device_cache.save(self.__scanned_devices)
+
+        await self.__open(self.__scanned_devices)
+
+    def __scan_devices(self) -> None:
         config = {
             "apiKey": os.getenv("TUYA_API_KEY"),
             "apiSecret": os.getenv("TUYA_API_SECRET"),
@@ -42,7 +139,7 @@ class LocalTuyaProcess(multiprocessing.Process):
         with open("devices.json", "r") as f:
             devices = loads(f.read())
 
-            self.__devices = []
+            self.__scanned_devices = []
             for device in devices:
                 if device["category"] == "dj":
                     data = {
@@ -53,113 +150,114 @@ class LocalTuyaProcess(multiprocessing.Process):
                         "version": device["version"],
                     }
 
-                    self.__devices.append(data)
+                    self.__scanned_devices.append(data)
 
         os.unlink("snapshot.json")
         os.unlink("tuya-raw.json")
         os.unlink("devices.json")
         os.unlink("tinytuya.json")
 
-    def __connect(self) -> None:
-        self.__lights = []
-        self.__initial_light_states = {}
-
-        for device in self.__devices:
-            light = BulbDevice(
-                dev_id=device["id"],
-                address=device["ip_address"],
-                local_key=device["local_key"],
-                version=device["version"],
-                persist=True,
-            )
-            self.__lights.append(light)
+    async def _connect(self) -> bool:
+        # Built in the child process; the cache wrapper cannot be pickled.
+        self.__encode_colour = lru_cache(maxsize=self.__payload_cache_size)(
+            encode_colour
+        )
 
-            status = light.status()
-            self.__initial_light_states[device["id"]] = status["dps"]
+        await self.__initialize()
 
-            light.set_mode("colour", nowait=True)
+        if not self.__connections:
+            return False
 
-        self.__connection_status = True
+        statuses = await asyncio.gather(
+            *(connection.status() for connection in self.__connections.values()),
+            return_exceptions=True,
+        )
 
-    def __send_light_state(self, brightness: int, rgb_color: List[int]) -> None:
-        br = brightness / 1000
-        hex = BulbDevice.rgb_to_hexvalue(*rgb_color, hexformat="hsv16")
-        h, s, _ = BulbDevice.hexvalue_to_hsv(hex, "hsv16")
-        value = BulbDevice.hsv_to_hexvalue(h, s, br, "hsv16")
+        self.__initial_light_states = {}
+        for light_id, status in zip(self.__connections, statuses):
+            if isinstance(status, Exception):
+                logger.warning(f"Status Failed ({light_id}): {status!r}")
+                continue
 
-        for i in range(len(self.__lights)):
-            # br = brightness / light.dpset["value_max"]
-            # value = BulbDevice.hsv_to_hexvalue(h, s, br, "hsv16")
+            self.__initial_light_states[light_id] = status
 
-            self.__lights[i].set_multiple_values(
-                {
-                    "21": "colour",
-                    "24": value,
-                },
-                nowait=True,
+        await asyncio.gather(
+            *(
+                connection.set_values({"21": "colour"})
+                for connection in self.__connections.values()
             )
+        )
 
-    def __recover_light_state(self) -> None:
-        for i in range(len(self.__lights)):
-            light = self.__lights[i]
-
-            if i == len(self.__lights) - 1:
-                nowait = False
-            else:
-                nowait = True
-
-            data = self.__initial_light_states[light.id]
-            light.set_multiple_values(data, nowait=nowait)
-
-        print("Initial State Restored")
-
-    def __push_states(self) -> None:
-        while True:
-            try:
-                br, cl = self.__process_queue.get(timeout=3)
-                print(f"Br: {br}, R: {cl[0]}, G: {cl[1]}, B: {cl[2]}")
-
-                self.__send_light_state(br, cl)
-            except queue.Empty:
-                print("Queue Empty")
-            finally:
-                if not self.__connection_status:
-                    print("Queue Closed")
-                    break
+        return True
 
-    def __close_connection(self) -> None:
-        for light in self.__lights:
-            light.close()
+    async def _fetch_lights(self) -> Tuple[List[str], Dict[str, str]]:
+        return list(self.__connections), {
+            device["name"]: device["id"] for device in self.__devices
+        }
 
-        self.__connection_status = False
+    async def _send(
+        self, lights: List[str], brightness: int, rgb_color: List[int]
+    ) -> bool:
+        step = self.__color_step
+        dps = self.__encode_colour(
+            brightness // step * step, *(c // step * step for c in rgb_color)
+        )
 
-        print("Connection Closed")
+        sent = await asyncio.gather(
+            *(self.__connections[light].set_values(dps) for light in lights)
+        )
 
-    def __send_ready_signal(self) -> None:
-        self.__process_connection.send("ready")
+        for light, ok in zip(lights, sent):
+            if not ok:
+                self._record_error(
+                    "backlogged"
+                    if self.__connections[light].connected
+                    else "disconnected"
+                )
+
+        return any(sent)
+
+    async def _recover(self) -> None:
+        await asyncio.gather(
+            *(
+                self.__connections[light_id].set_values(data, nowait=False)
+                for light_id, data in self.__initial_light_states.items()
+            )
+        )
 
-    def __process_connection_listener(self) -> None:
-        while True:
-            message = self.__process_connection.recv()
+        logger.info("Initial State Restored")
 
-            if message == "kill":
-                self.kill()
-                self.close()
+    async def __close_connection(self) -> None:
+        await asyncio.gather(
+            *(connection.close() for connection in self.__connections.values())
+        )
 
-                break
+        logger.info("Connection Closed")
 
-    def run(self) -> None:
-        self.__initialize()
-        self.__connect()
+    async def _close(self) -> None:
+        await self.__close_connection()
 
-        threading.Thread(target=self.__process_connection_listener, daemon=True).start()
+    def _stats(self) -> Dict[str, dict]:
+        connections = {
+            "sent": 0,
+            "skipped": 0,
+            "heartbeats": 0,
+            "reconnects": 0,
+            "errors": 0,
+        }
 
-        self.__send_ready_signal()
-        self.__push_states()
+        for connection in self.__connections.values():
+            for key, value in connection.stats().items():
+                connections[key] += value
 
-    def kill(self) -> None:
-        self.__recover_light_state()
-        sleep(0.25)
-        self.__close_connection()
+        cache = self.__encode_colour.cache_info()
 
-        print("Tuya Local Process Killed")
+        return {
+            **super()._stats(),
+            "Connections": connections,
+            "Payload Cache": {
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "size": cache.currsize,
+            },
+        }
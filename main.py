@@ -1,83 +1,317 @@
 import asyncio
+import atexit
+import logging
+import math
 import multiprocessing
 import os
 import signal
+import sys
 import threading
-from time import sleep
-from typing import List
+from typing import Callable, List
 
+import numpy as np
 from dotenv import load_dotenv
 
 from audio_input_stream_manager import AudioInputStreamManager
-from home_assistant_rest_api_process import HomeAssistantRestAPIProcess
-from home_assistant_websocket_process import HomeAssistantWebSocketProcess
-from local_tuya_process import LocalTuyaProcess
+from backend_registry import load_backend
+from config import apply_config, cli_overrides, load_config, parse_args
+from frame_ring_buffer import FrameRingBuffer
+from latency_calibration import FrameDelayLine, light_offset_ms, load_calibration
+from light_show_track import LightShowPlayer, load_track
+from onset_detector import BEAT_FRAME_SIZE
+from pipeline_metrics import MetricsExporter, MetricsRegistry, metrics_exporter_from_env
+from queue_logging import setup_logging
+from utils import stream_options_from_env
+
+logger = logging.getLogger(__name__)
 
 
 async def main() -> None:
+    # The command line beats the environment, which beats the config file,
+    # which beats .env.
+    args = parse_args()
+    apply_config(cli_overrides(args), override=True)
+    apply_config(load_config(args.config))
     load_dotenv()
-    backend = str(os.getenv("BACKEND")).lower()
+    atexit.register(setup_logging().stop)
+
+    if args.list_devices:
+        print(AudioInputStreamManager.list_devices())
+        return
+
+    backends = [
+        backend.strip()
+        for backend in str(os.getenv("BACKEND")).lower().split(",")
+        if backend.strip()
+    ]
 
     audio_manager = AudioInputStreamManager()
-    backend_process = None
 
-    ser_con, cli_con = multiprocessing.Pipe()
-    process_queue = multiprocessing.Queue()
+    try:
+        backend_process_classes = [load_backend(backend) for backend in backends]
+    except KeyError as e:
+        logger.error(f"Invalid Backend: {e}")
+        exit(1)
 
-    if backend == "restapi":
-        backend_process = HomeAssistantRestAPIProcess(cli_con, process_queue)
+    pipes = [multiprocessing.Pipe() for _ in backends]
 
-    elif backend == "websocket":
-        backend_process = HomeAssistantWebSocketProcess(cli_con, process_queue)
+    def callback(frame: np.ndarray, captured_at: float) -> None:
+        if delay_line:
+            delay_line.push(frame, captured_at)
+        else:
+            frame_buffer.put(frame, captured_at)
+
+    def block_callback(frame: np.ndarray, captured_at: float) -> None:
+        if block_delay_line:
+            block_delay_line.push(frame, captured_at)
+        else:
+            block_buffer.put(frame, captured_at)
+
+    def beat_callback(beat: np.ndarray, captured_at: float) -> None:
+        if beat_delay_line:
+            beat_delay_line.push(beat, captured_at)
+        else:
+            beat_buffer.put(beat, captured_at)
+
+    def finished_callback() -> None:
+        for ser_con, _ in pipes:
+            ser_con.send("kill")
 
-    elif backend == "local_tuya":
-        backend_process = LocalTuyaProcess(cli_con, process_queue)
+    calibration = load_calibration(os.getenv("LATENCY_CALIBRATION"))
+    latencies_ms = [
+        float(
+            os.getenv("LATENCY_MS", calibration.get(backend, {}).get("latency_ms", 0))
+        )
+        for backend in backends
+    ]
 
+    # The slowest backend sets the shared offset; faster ones hold frames back
+    # in their own reader so every backend lands at the same moment.
+    max_latency_ms = max(latencies_ms)
+    hold_ms = [max_latency_ms - latency_ms for latency_ms in latencies_ms]
+    offset_ms = light_offset_ms(max_latency_ms, float(os.getenv("AUDIO_DELAY_MS", 0)))
+
+    for backend, latency_ms, backend_hold_ms in zip(backends, latencies_ms, hold_ms):
+        logger.info(
+            f"{backend} Latency: {latency_ms:.1f} ms, Hold: {backend_hold_ms:.1f} ms"
+        )
+    logger.info(f"Light Offset: {offset_ms:.1f} ms")
+
+    # Held readers walk back through history, so keep enough slots for it.
+    stream_options = stream_options_from_env()
+    slots = 8 + math.ceil(max(hold_ms) / stream_options["output_ms"])
+
+    metrics = MetricsRegistry()
+
+    light_show_track = os.getenv("LIGHT_SHOW_TRACK")
+    player = None
+    delay_line = None
+    beat_buffer = None
+    beat_delay_line = None
+    block_buffer = None
+    block_delay_line = None
+    streaming = any(cls.streaming for cls in backend_process_classes)
+    beats = os.getenv("BEATS", "1") == "1"
+
+    if light_show_track:
+        audio_manager = None
+
+        timestamps, frames = load_track(light_show_track)
+        frame_buffer = FrameRingBuffer(frame_size=frames.shape[1], slots=slots)
+        player = LightShowPlayer(
+            frame_buffer,
+            timestamps,
+            frames,
+            lead_ms=float(os.getenv("LIGHT_SHOW_LEAD_MS", -offset_ms)),
+            finished_callback=finished_callback,
+        )
+        metrics.collect(
+            "light_show",
+            lambda: {
+                "played": player.played,
+                "late": player.late,
+                "max_lateness_seconds": player.max_lateness,
+            },
+            label="stat",
+        )
     else:
-        print("Invalid Backend")
-        exit(1)
+        audio_file = os.getenv("AUDIO_FILE")
 
-    def callback(br: int, cl: List[int]) -> None:
-        process_queue.put_nowait((br, cl))
+        if audio_file:
+            raw_samplerate = os.getenv("AUDIO_FILE_SAMPLERATE")
+            raw_channels = os.getenv("AUDIO_FILE_CHANNELS")
 
-    def finished_callback() -> None:
-        ser_con.send("kill")
-
-    audio_manager.initialize_input_device()
-    audio_manager.build_stream(
-        ms=500,
-        latency=None,
-        callback=callback,
-        finished_callback=finished_callback,
+            audio_manager.initialize_file_source(
+                audio_file,
+                realtime=os.getenv("AUDIO_FILE_REALTIME", "1") == "1",
+                samplerate=int(raw_samplerate) if raw_samplerate else None,
+                channels=int(raw_channels) if raw_channels else None,
+                dtype=os.getenv("AUDIO_FILE_DTYPE"),
+            )
+        else:
+            device = os.getenv("AUDIO_DEVICE")
+            raw_channels = os.getenv("AUDIO_CHANNELS")
+
+            # Without a terminal there is nobody to answer the prompts.
+            if device or raw_channels or not sys.stdin.isatty():
+                if not audio_manager.select_input_device(
+                    device or "default", int(raw_channels) if raw_channels else None
+                ):
+                    exit(1)
+            else:
+                audio_manager.initialize_input_device()
+
+        audio_manager.build_stream(
+            callback=callback,
+            finished_callback=finished_callback,
+            beat_callback=beat_callback if beats else None,
+            block_callback=block_callback if streaming else None,
+            metrics=metrics,
+            **stream_options,
+        )
+
+        frame_buffer = FrameRingBuffer(frame_size=audio_manager.frame_size, slots=slots)
+
+        # Beats travel on their own ring so they never wait for a smoothed frame.
+        if beats:
+            beat_buffer = FrameRingBuffer(frame_size=BEAT_FRAME_SIZE, slots=slots)
+
+        # Streaming backends get every block, so their ring holds the same
+        # history in more, shorter slots.
+        if streaming:
+            block_ms = audio_manager.stream.blocksize / audio_manager.samplerate * 1000
+            block_buffer = FrameRingBuffer(
+                frame_size=audio_manager.frame_size,
+                slots=8 + math.ceil(max(hold_ms) / block_ms),
+            )
+
+        if offset_ms > 0:
+            delay_line = FrameDelayLine(
+                frame_buffer.put, audio_manager.frame_size, offset_ms
+            )
+            metrics.collect("delay_line_dropped_total", lambda: delay_line.dropped)
+
+            if beat_buffer:
+                beat_delay_line = FrameDelayLine(
+                    beat_buffer.put, BEAT_FRAME_SIZE, offset_ms
+                )
+            if block_buffer:
+                block_delay_line = FrameDelayLine(
+                    block_buffer.put, audio_manager.frame_size, offset_ms
+                )
+        elif offset_ms < 0:
+            logger.warning(
+                f"Live Audio Cannot Look Ahead, Lights Trail By {-offset_ms:.0f} ms"
+            )
+
+    backend_processes = [
+        backend_process_class(
+            cli_con,
+            (
+                block_buffer
+                if block_buffer and backend_process_class.streaming
+                else frame_buffer
+            ),
+            hold_ms=backend_hold_ms,
+            metrics_port_offset=1 + i,
+            beat_buffer=beat_buffer,
+        )
+        for i, (backend_process_class, (_, cli_con), backend_hold_ms) in enumerate(
+            zip(backend_process_classes, pipes, hold_ms)
+        )
+    ]
+
+    exporter = metrics_exporter_from_env(metrics, "main")
+    if exporter:
+        exporter.start()
+
+    cleanup = setup_cleanup(
+        audio_manager,
+        backend_processes,
+        [frame_buffer, beat_buffer, block_buffer],
+        player,
+        [delay_line, beat_delay_line, block_delay_line],
+        exporter,
     )
 
-    setup_cleanup(audio_manager, backend_process)
+    for backend_process in backend_processes:
+        backend_process.start()
+
+    ready = 0
+    for backend, (ser_con, _) in zip(backends, pipes):
+        if ser_con.recv() == "ready":
+            ready += 1
+        else:
+            logger.error(f"{backend} Backend Failed To Start")
 
-    backend_process.start()
+    if ready:
+        logger.info(f"Ready Signal Received From {ready}/{len(backends)} Backends")
+        threading.Thread(target=(player or audio_manager).start, daemon=True).start()
+
+        # Backends exit once the source finishes or SIGINT stops it; only
+        # then is it safe to unlink the shared memory.
+        for backend_process in backend_processes:
+            backend_process.join()
+    else:
+        logger.error("No Backend Started")
 
-    if ser_con.recv() == "ready":
-        print("Ready Signal Received")
-        sleep(2)
-        threading.Thread(target=audio_manager.start, daemon=True).start()
+    cleanup()
 
 
 def setup_cleanup(
-    audio_manager: AudioInputStreamManager, backend_process: multiprocessing.Process
-) -> None:
+    audio_manager: AudioInputStreamManager | None,
+    backend_processes: List[multiprocessing.Process],
+    frame_buffers: List[FrameRingBuffer | None],
+    player: LightShowPlayer | None = None,
+    delay_lines: List[FrameDelayLine | None] | None = None,
+    exporter: MetricsExporter | None = None,
+) -> Callable[..., None]:
     def cleanup(
-        audio_manager: AudioInputStreamManager,
-        backend_process: multiprocessing.Process,
+        audio_manager: AudioInputStreamManager | None,
+        backend_processes: List[multiprocessing.Process],
+        frame_buffers: List[FrameRingBuffer | None],
+        player: LightShowPlayer | None,
+        delay_lines: List[FrameDelayLine | None],
+        exporter: MetricsExporter | None,
     ) -> None:
         if audio_manager:
             audio_manager.close()
-        if backend_process:
+        if player:
+            player.stop()
+        for delay_line in delay_lines:
+            if delay_line:
+                delay_line.stop()
+        for backend_process in backend_processes:
             backend_process.join()
+        for frame_buffer in frame_buffers:
+            if frame_buffer:
+                frame_buffer.close()
+        if exporter:
+            exporter.close()
+
+    closed = False
+    main_pid = os.getpid()
 
     def signal_handler(*_) -> None:
-        cleanup(audio_manager, backend_process)
+        nonlocal closed
+        # Forked backends inherit the handler; main sends them "kill".
+        if closed or os.getpid() != main_pid:
+            return
+        closed = True
+
+        cleanup(
+            audio_manager,
+            backend_processes,
+            frame_buffers,
+            player,
+            delay_lines or [],
+            exporter,
+        )
 
     signal.signal(signal.SIGINT, signal_handler)
 
+    return signal_handler
+
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,144 @@
+from typing import List, Tuple
+
+import numpy as np
+
+BEAT_FRAME_SIZE = 2
+
+
+def accent_color(
+    brightness: int, rgb_color: List[int], strength: int
+) -> Tuple[int, List[int]]:
+    level = max(brightness, strength)
+    peak = max(rgb_color)
+
+    if peak == 0:
+        return level, [level, level, level]
+
+    return level, [min(round(c * level / peak), 255) for c in rgb_color]
+
+
+class OnsetDetector:
+    def __init__(
+        self,
+        bins: int,
+        samplerate: int,
+        blocksize: int,
+        sensitivity: float = 1.5,
+        min_ratio: float = 1.3,
+        window_ms: float = 1000,
+        min_interval_ms: float = 100,
+        min_bpm: int = 60,
+        max_bpm: int = 180,
+        compression: float = 100,
+    ) -> None:
+        self.sensitivity = sensitivity
+        self.min_ratio = min_ratio
+        self.compression = compression
+        self.block_seconds = blocksize / samplerate
+        self.min_interval = min_interval_ms / 1000
+        self.min_bpm = min_bpm
+        self.max_bpm = max_bpm
+
+        window = max(window_ms / 1000 / self.block_seconds, 1)
+        self.__alpha = 2 / (window + 1)
+
+        # Matches the analyzer's magnitude so nothing is cast per block.
+        self.__mono = np.zeros(bins, dtype=np.float64)
+        self.__previous = np.zeros(bins, dtype=np.float64)
+        self.__delta = np.zeros(bins, dtype=np.float64)
+
+        # Running mean and variance stand in for a history of flux values.
+        self.__mean = 0.0
+        self.__variance = 0.0
+        self.__armed = True
+        self.__warmup = max(int(window // 4), 1)
+
+        self.__onset_times = np.full(8, -np.inf, dtype=np.float64)
+        self.__onset_index = 0
+        self.__tempo_scores = np.zeros(max_bpm - min_bpm + 1, dtype=np.float64)
+
+        self.time = 0.0
+        self.flux = 0.0
+        self.threshold = 0.0
+        self.strength = 0.0
+        self.bpm = 0
+        self.onsets = 0
+
+    def update(self, magnitude: np.ndarray) -> bool:
+        self.time += self.block_seconds
+
+        np.sum(magnitude[: self.__mono.shape[0]], axis=1, out=self.__mono)
+        np.multiply(self.__mono, self.compression, out=self.__mono)
+        np.log1p(self.__mono, out=self.__mono)
+
+        np.subtract(self.__mono, self.__previous, out=self.__delta)
+        np.maximum(self.__delta, 0, out=self.__delta)
+        np.copyto(self.__previous, self.__mono)
+
+        flux = float(self.__delta.sum())
+        self.flux = flux
+        self.threshold = max(
+            self.__mean + self.sensitivity * self.__variance**0.5,
+            self.__mean * self.min_ratio,
+        )
+
+        deviation = flux - self.__mean
+        self.__mean += self.__alpha * deviation
+        self.__variance = (1 - self.__alpha) * (
+            self.__variance + self.__alpha * deviation * deviation
+        )
+
+        if flux <= self.__mean:
+            self.__armed = True
+
+        if self.__warmup:
+            self.__warmup -= 1
+            return False
+
+        last_onset = self.__onset_times[self.__onset_index - 1]
+        if (
+            not self.__armed
+            or flux <= self.threshold
+            or self.time - last_onset < self.min_interval
+        ):
+            return False
+
+        self.__armed = False
+        # Sound straight after digital silence leaves no threshold to scale by.
+        self.strength = (
+            min(flux / (2 * self.threshold), 1.0) if self.threshold > 0 else 1.0
+        )
+        self.onsets += 1
+
+        self.__update_tempo()
+
+        return True
+
+    def __update_tempo(self) -> None:
+        intervals = self.time - self.__onset_times
+        intervals = intervals[np.isfinite(intervals)]
+
+        self.__onset_times[self.__onset_index] = self.time
+        self.__onset_index = (self.__onset_index + 1) % self.__onset_times.shape[0]
+
+        np.multiply(self.__tempo_scores, 0.9, out=self.__tempo_scores)
+
+        for interval in intervals:
+            bpm = 60 / interval
+
+            # Fold double and half time into one octave.
+            while bpm < self.min_bpm:
+                bpm *= 2
+            while bpm > self.max_bpm:
+                bpm /= 2
+
+            self.__tempo_scores[round(bpm) - self.min_bpm] += self.strength
+
+        if self.__tempo_scores.any():
+            self.bpm = int(self.__tempo_scores.argmax()) + self.min_bpm
+
+    def write(self, beat: np.ndarray) -> np.ndarray:
+        beat[0] = round(self.strength * 255)
+        beat[1] = min(self.bpm, 255)
+
+        return beat
@@ -0,0 +1,260 @@
+import logging
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    pairs = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        total, cumulative = 0, []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+
+        return cumulative
+
+
+class MetricsRegistry:
+    # Lock-free on purpose: updates come from the audio callback and send
+    # threads, and a rare lost increment is cheaper than a contended lock.
+    def __init__(self, namespace: str = "vibe_lights") -> None:
+        self.namespace = namespace
+
+        self.__kinds: Dict[str, Tuple[str, str]] = {}
+        self.__values: Dict[str, Dict[Labels, float | Histogram]] = {}
+        self.__collectors: Dict[str, Tuple[Callable, str | None]] = {}
+
+    def describe(self, name: str, kind: str, help: str) -> None:
+        self.__kinds[name] = (kind, help)
+        self.__values.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        samples = self.__values.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        samples[key] = samples.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self.__values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        samples = self.__values.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+
+        histogram = samples.get(key)
+        if histogram is None:
+            histogram = samples[key] = Histogram()
+
+        histogram.observe(value)
+
+    def collect(self, name: str, collector: Callable, label: str | None = None) -> None:
+        # Read at scrape time, so hot loops do not pay for the gauge. With a
+        # label the collector returns a dict, e.g. a component's stats().
+        self.__collectors[name] = (collector, label)
+
+    def __samples(self) -> Dict[str, Dict[Labels, float | Histogram]]:
+        samples = dict(self.__values)
+
+        for name, (collector, label) in self.__collectors.items():
+            try:
+                if label is None:
+                    samples[name] = {(): float(collector())}
+                else:
+                    samples[name] = {
+                        ((label, str(key)),): float(value)
+                        for key, value in collector().items()
+                    }
+            except Exception as e:
+                logger.warning(f"Metric Collector Failed ({name}): {e!r}")
+
+        return samples
+
+    def render(self) -> str:
+        lines = []
+
+        for name, samples in self.__samples().items():
+            full_name = f"{self.namespace}_{name}"
+            histogram = any(isinstance(value, Histogram) for value in samples.values())
+            kind, help = self.__kinds.get(
+                name, ("histogram" if histogram else "untyped", "")
+            )
+
+            if help:
+                lines.append(f"# HELP {full_name} {help}")
+            lines.append(f"# TYPE {full_name} {kind}")
+
+            for labels, value in list(samples.items()):
+                if not isinstance(value, Histogram):
+                    lines.append(f"{full_name}{format_labels(labels)} {value}")
+                    continue
+
+                bounds = [*map(str, value.buckets), "+Inf"]
+                for bound, count in zip(bounds, value.cumulative()):
+                    le = f'le="{bound}"'
+                    lines.append(
+                        f"{full_name}_bucket{format_labels(labels, le)} {count}"
+                    )
+                lines.append(f"{full_name}_sum{format_labels(labels)} {value.sum}")
+                lines.append(f"{full_name}_count{format_labels(labels)} {value.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+
+        for name, samples in self.__samples().items():
+            for labels, value in list(samples.items()):
+                key = name + format_labels(labels)
+
+                if isinstance(value, Histogram):
+                    snapshot[key] = {
+                        "count": value.count,
+                        "sum": value.sum,
+                        "mean": value.sum / value.count if value.count else 0.0,
+                        "buckets": dict(
+                            zip([*map(str, value.buckets), "+Inf"], value.counts)
+                        ),
+                    }
+                else:
+                    snapshot[key] = value
+
+        return snapshot
+
+
+class MetricsExporter:
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        port: int | None = None,
+        json_path: str | None = None,
+        interval_ms: float = 5000,
+        host: str = "127.0.0.1",
+    ) -> None:
+        self.registry = registry
+        self.port = port
+        self.json_path = json_path
+        self.interval = interval_ms / 1000
+        self.host = host
+
+        self.__server = None
+        self.__stopped = threading.Event()
+
+    def start(self) -> None:
+        if self.port is not None:
+            self.__server = ThreadingHTTPServer(
+                (self.host, self.port), self.__handler()
+            )
+            self.__server.daemon_threads = True
+            threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+            logger.info(f"Metrics: http://{self.host}:{self.port}/metrics")
+
+        if self.json_path:
+            os.makedirs(os.path.dirname(self.json_path) or ".", exist_ok=True)
+            threading.Thread(target=self.__dump_periodically, daemon=True).start()
+
+    def __handler(self) -> type:
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == "/metrics":
+                    body = registry.render().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_) -> None:
+                pass
+
+        return Handler
+
+    def __dump(self) -> None:
+        temporary_path = f"{self.json_path}.tmp"
+
+        with open(temporary_path, "w") as f:
+            f.write(dumps(self.registry.snapshot(), indent=4))
+
+        os.replace(temporary_path, self.json_path)
+
+    def __dump_periodically(self) -> None:
+        while not self.__stopped.wait(self.interval):
+            self.__dump()
+
+    def close(self) -> None:
+        self.__stopped.set()
+
+        if self.__server:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+        if self.json_path:
+            self.__dump()
+
+
+def metrics_exporter_from_env(
+    registry: MetricsRegistry, name: str, port_offset: int = 0
+) -> MetricsExporter | None:
+    port = os.getenv("METRICS_PORT")
+    json_dir = os.getenv("METRICS_JSON_DIR")
+
+    if not port and not json_dir:
+        return None
+
+    return MetricsExporter(
+        registry,
+        port=int(port) + port_offset if port else None,
+        json_path=os.path.join(json_dir, f"{name}.json") if json_dir else None,
+        interval_ms=float(os.getenv("METRICS_INTERVAL_MS", 5000)),
+        host=os.getenv("METRICS_HOST", "127.0.0.1"),
+    )
@@ -0,0 +1,90 @@
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from time import monotonic
+
+import numpy as np
+
+QUIET_LOGGERS = ("httpx", "httpcore")
+
+LOG_FORMAT = "%(asctime)s %(processName)s %(name)s %(levelname)s: %(message)s"
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # A full queue means the terminal is behind; drop rather than block.
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    level: str | None = None, queue_size: int | None = None
+) -> QueueListener:
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    queue_size = queue_size or int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    # Replace whatever a forked parent left behind; its listener thread
+    # does not exist in this process.
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    # httpx logs every request at INFO, which would be one line per frame.
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    listener.start()
+
+    return listener
+
+
+class FrameLogSummary:
+    def __init__(self, logger: logging.Logger, interval_ms: float = 1000) -> None:
+        self.logger = logger
+        self.interval = interval_ms / 1000
+
+        self.__frames = 0
+        self.__started_at = monotonic()
+
+    def update(self, frame: np.ndarray, skipped: int) -> None:
+        self.__frames += 1
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Frame: %s", frame.tolist())
+
+        now = monotonic()
+        elapsed = now - self.__started_at
+        if elapsed < self.interval:
+            return
+
+        br, r, g, b = frame[:4].tolist()
+        self.logger.info(
+            "%d Frames In %.1f s, Br: %d, R: %d, G: %d, B: %d, Skipped: %d",
+            self.__frames,
+            elapsed,
+            br,
+            r,
+            g,
+            b,
+            skipped,
+        )
+
+        self.__frames = 0
+        self.__started_at = now
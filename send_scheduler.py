@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LatestValueScheduler:
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[bool]],
+        max_in_flight: int = 1,
+        deadline: float | None = None,
+        on_drop: Callable[..., None] | None = None,
+    ) -> None:
+        self.__send = send
+        self.__on_drop = on_drop
+        self.__max_in_flight = max_in_flight
+        self.__deadline = deadline
+
+        self.__pending: Dict[Hashable, Tuple[float, Tuple[Any, ...]]] = {}
+        self.__in_flight: Dict[Hashable, int] = {}
+        self.__tasks: Set[asyncio.Task] = set()
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.stale = 0
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self.__in_flight.values())
+
+    @property
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    def submit(self, key: Hashable, *args: Any) -> None:
+        self.submitted += 1
+
+        if self.__in_flight.get(key, 0) < self.__max_in_flight:
+            self.__start(key, args)
+            return
+
+        if key in self.__pending:
+            self.coalesced += 1
+
+        self.__pending[key] = (monotonic(), args)
+
+    def __start(self, key: Hashable, args: Tuple[Any, ...]) -> None:
+        self.__in_flight[key] = self.__in_flight.get(key, 0) + 1
+
+        task = asyncio.get_running_loop().create_task(self.__run(key, args))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __run(self, key: Hashable, args: Tuple[Any, ...]) -> None:
+        try:
+            if await self.__send(*args):
+                self.sent += 1
+            else:
+                self.__drop(args)
+        except Exception as e:
+            self.__drop(args)
+            logger.warning(f"Send Failed: {e!r}")
+        finally:
+            self.__in_flight[key] -= 1
+
+            pending = self.__pending.pop(key, None)
+            if pending is None:
+                return
+
+            # A value that waited out the deadline behind a slow send is
+            # already out of date; the next frame replaces it.
+            submitted_at, args = pending
+            if self.__deadline and monotonic() - submitted_at > self.__deadline:
+                self.stale += 1
+                self.__notify_drop(args)
+            else:
+                self.__start(key, args)
+
+    def __drop(self, args: Tuple[Any, ...]) -> None:
+        self.dropped += 1
+        self.__notify_drop(args)
+
+    def __notify_drop(self, args: Tuple[Any, ...]) -> None:
+        # Lets the caller forget a value it assumed went out.
+        if self.__on_drop:
+            self.__on_drop(*args)
+
+    async def drain(self) -> None:
+        for _, args in self.__pending.values():
+            self.__drop(args)
+
+        self.__pending.clear()
+
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+        }
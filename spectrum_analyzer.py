@@ -0,0 +1,199 @@
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+from band_normalizer import BandNormalizer
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+logger = logging.getLogger(__name__)
+
+
+RGB_BANDS = [(20, 250), (250, 4000), (4000, 12000)]
+
+
+def hz_to_mel(hz: np.ndarray) -> np.ndarray:
+    return 2595 * np.log10(1 + hz / 700)
+
+
+def mel_to_hz(mel: np.ndarray) -> np.ndarray:
+    return 700 * (10 ** (mel / 2595) - 1)
+
+
+def edges_to_bands(edges: List[float]) -> List[Tuple[float, float]]:
+    return [(float(ll), float(hl)) for ll, hl in zip(edges[:-1], edges[1:])]
+
+
+def build_bands(
+    layout: str = "rgb",
+    count: int = 3,
+    low: float = 20,
+    high: float = 12000,
+    edges: List[float] | None = None,
+) -> List[Tuple[float, float]]:
+    if layout == "rgb":
+        return RGB_BANDS
+    elif layout == "log":
+        return edges_to_bands(np.geomspace(low, high, count + 1))
+    elif layout == "mel":
+        return edges_to_bands(
+            mel_to_hz(np.linspace(hz_to_mel(low), hz_to_mel(high), count + 1))
+        )
+    elif layout == "custom":
+        if not edges or len(edges) < 2:
+            raise ValueError("Custom band layout needs at least two edges")
+
+        return edges_to_bands(sorted(edges))
+
+    raise ValueError(f"Unknown band layout: {layout}")
+
+
+class SpectrumAnalyzer:
+    def __init__(
+        self,
+        samplerate: int,
+        blocksize: int,
+        channels: int,
+        bands: List[Tuple[float, float]],
+        fft_backend: str = "auto",
+        normalizer: BandNormalizer | None = None,
+    ) -> None:
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.normalizer = normalizer
+
+        # numpy's rfft can write into a preallocated output; scipy cannot.
+        if fft_backend == "auto":
+            fft_backend = "numpy"
+        elif fft_backend == "scipy" and scipy_fft is None:
+            logger.warning("scipy is not installed, falling back to numpy fft")
+            fft_backend = "numpy"
+
+        self.fft_backend = fft_backend
+
+        self.freqs = np.fft.rfftfreq(blocksize, 1.0 / samplerate)
+        bins = self.freqs.shape[0]
+
+        self.bands = self.__find_band_edges(bands)
+        band_count = self.bands.shape[0]
+
+        # Interleaved [start, stop) pairs let a single reduceat pass cover
+        # overlapping or gapped bands; the odd segments are discarded.
+        self.__reduce_indices = self.bands.ravel()
+        self.__inverse_counts = 1 / ((self.bands[:, 1] - self.bands[:, 0]) * channels)
+
+        color_groups = np.arange(3) * band_count // 3
+        self.__color_indices = np.minimum(color_groups, band_count - 1)
+
+        # Channel-major float64 buffers: pocketfft only skips its own copies
+        # for contiguous rows of doubles, and ufuncs only skip theirs when
+        # nothing is broadcast or cast.
+        self.__window = np.tile(np.hanning(blocksize), (channels, 1))
+        self.__windowed = np.empty((channels, blocksize), dtype=np.float64)
+        self.__spectrum = np.empty((channels, bins), dtype=np.complex128)
+
+        # One extra zero bin keeps stop indices at the top bin valid for reduceat.
+        magnitude = np.zeros((channels, bins + 1), dtype=np.float64)
+        self.__magnitude_rows = [
+            (spectrum, row) for spectrum, row in zip(self.__spectrum, magnitude[:, :-1])
+        ]
+        self.__magnitude = magnitude.T
+        self.magnitude = self.__magnitude
+
+        self.__band_sums = np.empty((band_count * 2, channels), dtype=np.float64)
+        self.__band_peaks = np.empty((band_count * 2, channels), dtype=np.float64)
+        self.__band_avg = np.empty(band_count, dtype=np.float64)
+        self.__band_max = np.empty(band_count, dtype=np.float64)
+        self.__half_max = np.empty(band_count, dtype=np.float64)
+        self.__peaky = np.empty(band_count, dtype=bool)
+
+        self.levels = np.zeros(band_count, dtype=np.float64)
+        self.color = np.zeros(3, dtype=np.float64)
+
+    def __find_band_edges(self, bands: List[Tuple[float, float]]) -> np.ndarray:
+        bins = self.freqs.shape[0]
+        lows, highs = np.array(bands, dtype=np.float64).T
+
+        li = np.searchsorted(self.freqs, lows, side="right") - 1
+        ri = np.searchsorted(self.freqs, highs, side="left") + 1
+
+        li = np.clip(li, 0, bins - 1)
+        ri = np.clip(np.maximum(ri, li + 1), 1, bins)
+
+        return np.stack([li, ri], axis=1)
+
+    def __transform(self, indata: np.ndarray) -> np.ndarray:
+        np.copyto(self.__windowed, indata.T)
+        np.multiply(self.__windowed, self.__window, out=self.__windowed)
+
+        if self.fft_backend == "scipy":
+            spectrum = scipy_fft.rfft(self.__windowed, axis=-1, overwrite_x=True)
+            np.abs(spectrum, out=self.__magnitude[:-1].T)
+        else:
+            np.fft.rfft(self.__windowed, axis=-1, out=self.__spectrum)
+
+            for spectrum, row in self.__magnitude_rows:
+                np.abs(spectrum, out=row)
+
+        return self.__magnitude
+
+    def analyze(self, indata: np.ndarray) -> np.ndarray:
+        magnitude = self.__transform(indata)
+
+        np.add.reduceat(magnitude, self.__reduce_indices, axis=0, out=self.__band_sums)
+        np.maximum.reduceat(
+            magnitude, self.__reduce_indices, axis=0, out=self.__band_peaks
+        )
+
+        np.sum(self.__band_sums[::2], axis=1, out=self.__band_avg)
+        np.multiply(self.__band_avg, self.__inverse_counts, out=self.__band_avg)
+        np.max(self.__band_peaks[::2], axis=1, out=self.__band_max)
+
+        np.multiply(self.__band_max, 0.5, out=self.__half_max)
+        np.greater(self.__half_max, self.__band_avg, out=self.__peaky)
+
+        np.copyto(self.levels, self.__band_avg)
+        np.copyto(self.levels, self.__band_max, where=self.__peaky)
+
+        if self.normalizer:
+            self.normalizer.apply(self.levels)
+
+        np.maximum.reduceat(self.levels, self.__color_indices, out=self.color)
+
+        return self.levels
+
+    def analyze_blocks(self, blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        windowed = blocks * self.__window[0, :, None]
+
+        if self.fft_backend == "scipy":
+            spectrum = scipy_fft.rfft(windowed, axis=1, overwrite_x=True)
+        else:
+            spectrum = np.fft.rfft(windowed, axis=1)
+
+        magnitude = np.zeros(
+            (blocks.shape[0], self.freqs.shape[0] + 1, self.channels), dtype=np.float32
+        )
+        np.abs(spectrum, out=magnitude[:, :-1])
+
+        band_sums = np.add.reduceat(magnitude, self.__reduce_indices, axis=1)[:, ::2]
+        band_peaks = np.maximum.reduceat(magnitude, self.__reduce_indices, axis=1)[
+            :, ::2
+        ]
+
+        band_avg = band_sums.sum(axis=2) * self.__inverse_counts
+        band_max = band_peaks.max(axis=2).astype(np.float64)
+
+        levels = np.where(band_max / 2 > band_avg, band_max, band_avg)
+
+        if self.normalizer:
+            for row in levels:
+                self.normalizer.apply(row)
+
+        colors = np.maximum.reduceat(levels, self.__color_indices, axis=1)
+
+        return levels, colors
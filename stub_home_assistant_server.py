@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+from json import dumps, loads
+from typing import List
+
+REASONS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def build_light_states(count: int) -> List[dict]:
+    return [
+        {
+            "entity_id": f"light.stub_{i}",
+            "state": "on",
+            "attributes": {
+                "effect": None,
+                "color_mode": "rgb",
+                "brightness": 255,
+                "color_temp_kelvin": None,
+                "color_temp": None,
+                "hs_color": [0.0, 0.0],
+                "rgb_color": [255, 255, 255],
+                "xy_color": [0.323, 0.329],
+                "raw_state": True,
+                "raw_color_mode": "colour",
+                "raw_color": None,
+                "raw_brightness": 1000,
+                "raw_color_temp": None,
+            },
+        }
+        for i in range(count)
+    ]
+
+
+class StubHomeAssistantServer:
+    def __init__(self, lights: int = 4, latency_ms: float = 0) -> None:
+        self.states = build_light_states(lights)
+        self.services = [
+            {"domain": "light", "services": {"turn_on": {}, "turn_off": {}}}
+        ]
+        self.latency = latency_ms / 1000
+
+        self.requests = 0
+        self.service_calls = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8123) -> None:
+        self.server = await asyncio.start_server(self.__handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        await self.server.serve_forever()
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.__route(method, path, body)
+                data = dumps(payload).encode()
+
+                head = (
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n"
+                )
+                writer.write(head.encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def __route(self, method: str, path: str, body: bytes) -> tuple:
+        self.requests += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if path == "/api/states" and method == "GET":
+            return 200, self.states
+
+        if path == "/api/services" and method == "GET":
+            return 200, self.services
+
+        if path.startswith("/api/services/light/"):
+            if method != "POST":
+                return 405, {"message": "Method not allowed"}
+
+            loads(body or b"{}")
+            self.service_calls += 1
+
+            return 200, []
+
+        return 404, {"message": "Not found"}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--lights", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server = StubHomeAssistantServer(lights=args.lights, latency_ms=args.latency_ms)
+    await server.start(args.host, args.port)
+
+    print(f"Stub Home Assistant listening on {args.host}:{server.port}")
+
+    await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
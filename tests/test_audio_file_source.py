@@ -0,0 +1,74 @@
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from audio_file_source import AudioFile, AudioFileStream
+
+
+def write_wav(path, chunks):
+    body = b"WAVE" + b"".join(
+        struct.pack("<4sI", chunk_id, len(data)) + data for chunk_id, data in chunks
+    )
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+    return str(path)
+
+
+def fmt_chunk(channels=1, samplerate=8000, bits=16):
+    block_align = channels * bits // 8
+
+    return (
+        b"fmt ",
+        struct.pack(
+            "<HHIIHH",
+            1,
+            channels,
+            samplerate,
+            samplerate * block_align,
+            block_align,
+            bits,
+        ),
+    )
+
+
+def data_chunk(samples):
+    return b"data", np.asarray(samples, dtype="<i2").tobytes()
+
+
+def test_reads_pcm_wav(tmp_path):
+    path = write_wav(tmp_path / "a.wav", [fmt_chunk(), data_chunk([0, 16384, -32768])])
+    audio_file = AudioFile(path)
+    out = np.empty((3, 1), dtype=np.float32)
+
+    assert audio_file.read(0, out) == 3
+    np.testing.assert_allclose(out[:, 0], [0.0, 0.5, -1.0])
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [[data_chunk([0, 1])], [data_chunk([0, 1]), fmt_chunk()]],
+    ids=["missing", "after data"],
+)
+def test_wav_without_a_leading_fmt_chunk_is_rejected(tmp_path, chunks):
+    path = write_wav(tmp_path / "a.wav", chunks)
+
+    with pytest.raises(ValueError, match="no fmt chunk"):
+        AudioFile(path)
+
+
+def test_stream_finishes_when_the_callback_raises(tmp_path):
+    path = write_wav(tmp_path / "a.wav", [fmt_chunk(), data_chunk(np.zeros(64))])
+    finished = threading.Event()
+
+    def callback(*_):
+        raise RuntimeError("analysis failed")
+
+    stream = AudioFileStream(
+        AudioFile(path), 16, callback, finished_callback=finished.set, realtime=False
+    )
+    stream.start()
+
+    assert finished.wait(5)
+    stream.stop()
@@ -0,0 +1,57 @@
+import multiprocessing
+from json import loads
+
+from latency_calibration import LatencyTracker, save_calibration
+
+
+def record_frames(tracker, hold, count=10):
+    # 1 ms analysis, 2 ms polling once the frame may be read, 3 ms sending.
+    for i in range(count):
+        captured_at = float(i)
+        published_at = captured_at + 0.001
+        received_at = max(published_at, captured_at + hold) + 0.002
+
+        tracker.record(captured_at, published_at, received_at, received_at + 0.003)
+
+
+def test_hold_is_left_out_of_the_measured_latency():
+    unheld = LatencyTracker()
+    held = LatencyTracker(hold=0.050)
+
+    record_frames(unheld, hold=0)
+    record_frames(held, hold=0.050)
+
+    assert unheld.summary()["total"]["p50"] == 6.0
+    assert held.summary() == unheld.summary()
+
+
+def test_saved_latency_does_not_depend_on_the_hold(tmp_path):
+    path = tmp_path / "calibration.json"
+
+    for hold in (0, 0.050, 0.200):
+        tracker = LatencyTracker(hold=hold)
+        record_frames(tracker, hold=hold)
+        save_calibration(str(path), f"hold {hold}", tracker, device_latency_ms=10)
+
+    latencies = [values["latency_ms"] for values in loads(path.read_text()).values()]
+
+    assert latencies == [16.0, 16.0, 16.0]
+
+
+def test_concurrent_saves_keep_every_backend(tmp_path):
+    path = str(tmp_path / "calibration.json")
+    backends = [f"backend {i}" for i in range(8)]
+    trackers = []
+
+    for _ in backends:
+        tracker = LatencyTracker()
+        record_frames(tracker, hold=0)
+        trackers.append(tracker)
+
+    with multiprocessing.Pool(len(backends)) as pool:
+        pool.starmap(
+            save_calibration, [(path, b, t) for b, t in zip(backends, trackers)]
+        )
+
+    with open(path) as f:
+        assert sorted(loads(f.read())) == backends
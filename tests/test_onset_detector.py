@@ -0,0 +1,38 @@
+import numpy as np
+
+from onset_detector import OnsetDetector
+
+SAMPLERATE = 44100
+BLOCKSIZE = 1024
+BINS = BLOCKSIZE // 2 + 1
+
+
+def test_sound_after_digital_silence_is_a_full_strength_onset():
+    detector = OnsetDetector(BINS, SAMPLERATE, BLOCKSIZE)
+    silence = np.zeros((BINS, 2), dtype=np.float32)
+
+    # A second of silence leaves the rolling mean and variance at zero.
+    for _ in range(SAMPLERATE // BLOCKSIZE):
+        assert not detector.update(silence)
+
+    assert detector.threshold == 0.0
+
+    assert detector.update(np.ones((BINS, 2), dtype=np.float32))
+    assert detector.strength == 1.0
+    assert detector.onsets == 1
+
+
+def test_steady_sound_after_an_onset_does_not_retrigger():
+    detector = OnsetDetector(BINS, SAMPLERATE, BLOCKSIZE)
+    silence = np.zeros((BINS, 2), dtype=np.float32)
+    sound = np.ones((BINS, 2), dtype=np.float32)
+
+    for _ in range(SAMPLERATE // BLOCKSIZE):
+        detector.update(silence)
+
+    detector.update(sound)
+
+    for _ in range(20):
+        assert not detector.update(sound)
+
+    assert detector.onsets == 1
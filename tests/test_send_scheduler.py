@@ -0,0 +1,69 @@
+import asyncio
+
+from delta_filter import DeltaFilter
+from send_scheduler import LatestValueScheduler
+
+
+def test_drain_drops_the_coalesced_pending_value():
+    sent = []
+
+    async def send(value):
+        await asyncio.sleep(0.01)
+        sent.append(value)
+
+        return True
+
+    async def main():
+        dropped = []
+        scheduler = LatestValueScheduler(
+            send, on_drop=lambda *args: dropped.append(args)
+        )
+
+        for value in ("a", "b", "c"):
+            scheduler.submit(0, value)
+
+        await scheduler.drain()
+
+        return scheduler, dropped
+
+    scheduler, dropped = asyncio.run(main())
+
+    assert sent == ["a"]
+    assert scheduler.coalesced == 1
+    assert dropped == [("c",)]
+
+
+def test_failed_and_stale_values_are_reported_as_dropped():
+    async def send(value):
+        await asyncio.sleep(0.05)
+
+        return value != "fails"
+
+    async def main():
+        dropped = []
+        scheduler = LatestValueScheduler(
+            send, deadline=0.01, on_drop=lambda *args: dropped.append(args)
+        )
+
+        scheduler.submit(0, "fails")
+        scheduler.submit(0, "stale")
+        await asyncio.sleep(0.1)
+
+        return scheduler, dropped
+
+    scheduler, dropped = asyncio.run(main())
+
+    assert dropped == [("fails",), ("stale",)]
+    assert scheduler.dropped == 1
+    assert scheduler.stale == 1
+
+
+def test_dropped_value_is_resent_after_a_small_change():
+    delta_filter = DeltaFilter(threshold=3, keepalive_ms=1000)
+
+    assert delta_filter.should_send(0, 200, [200, 0, 0])
+    assert not delta_filter.should_send(0, 201, [201, 0, 0])
+
+    delta_filter.invalidate(0)
+
+    assert delta_filter.should_send(0, 201, [201, 0, 0])
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from spectrum_analyzer import SpectrumAnalyzer, build_bands
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_batch_analysis_matches_block_by_block(channels):
+    analyzer = SpectrumAnalyzer(44100, 1024, channels, build_bands("log", 12))
+    blocks = (
+        np.random.default_rng(0).uniform(-1, 1, (4, 1024, channels)).astype(np.float32)
+    )
+
+    levels, colors = analyzer.analyze_blocks(blocks)
+
+    for block, block_levels, block_colors in zip(blocks, levels, colors):
+        np.testing.assert_allclose(analyzer.analyze(block), block_levels, rtol=1e-5)
+        np.testing.assert_allclose(analyzer.color, block_colors, rtol=1e-5)
+
+
+def test_magnitude_is_bins_by_channels_with_a_zero_pad_row():
+    analyzer = SpectrumAnalyzer(44100, 1024, 2, build_bands("rgb"))
+    tone = np.sin(2 * np.pi * 1000 * np.arange(1024) / 44100, dtype=np.float64)
+
+    analyzer.analyze(np.stack([tone, np.zeros(1024)], axis=1).astype(np.float32))
+
+    assert analyzer.magnitude.shape == (514, 2)
+    assert analyzer.magnitude[-1].tolist() == [0.0, 0.0]
+    assert analyzer.magnitude[:, 1].max() == 0.0
+    assert analyzer.freqs[analyzer.magnitude[:-1, 0].argmax()] == pytest.approx(
+        1000, abs=44100 / 1024
+    )
@@ -0,0 +1,255 @@
+import asyncio
+import hmac
+import os
+import struct
+from hashlib import sha256
+
+import pytest
+from tinytuya import Device
+from tinytuya.core.crypto_helper import AESCipher
+from tinytuya.core.message_helper import MessagePayload, TuyaMessage
+from tinytuya.core.message_helper import pack_message, unpack_message
+
+import tuya_local_client
+from tuya_local_client import (
+    CONTROL,
+    CONTROL_NEW,
+    DP_QUERY,
+    DP_QUERY_NEW,
+    PREFIX_55AA,
+    PREFIX_6699,
+    SESS_KEY_NEG_FINISH,
+    SESS_KEY_NEG_RESP,
+    SESS_KEY_NEG_START,
+    STATUS,
+    TuyaCipher,
+    TuyaConnection,
+    TuyaProtocolError,
+    read_message,
+)
+
+DEVICE_ID = "bf0123456789abcdefghij"
+LOCAL_KEY = b"0123456789abcdef"
+SESSION_KEY = b"fedcba9876543210"
+IV = bytes(range(12))
+PAYLOAD = b'{"protocol":5,"t":1700000000,"data":{"dps":{"20":true}}}'
+
+
+def tinytuya_device(version, key=LOCAL_KEY, seqno=1):
+    device = Device(DEVICE_ID, "127.0.0.1", key.decode(), version=version)
+    device.seqno = seqno
+
+    return device
+
+
+def split(data):
+    size = 18 if data[:4] == struct.pack(">I", PREFIX_6699) else 16
+
+    return data[:size], data[size:]
+
+
+def device_reply(version, key, seqno, cmd, payload):
+    # Devices prefix their replies with a retcode; 3.4 and 3.5 carry the
+    # version header inside the encrypted payload, 3.3 outside of it.
+    cipher = AESCipher(key)
+    header = f"{version:.1f}".encode() + b"\x00" * 12
+
+    if version >= 3.5:
+        message = TuyaMessage(seqno, cmd, 0, payload, 0, True, PREFIX_6699, IV)
+        return pack_message(message, hmac_key=key)
+
+    if version >= 3.4:
+        if cmd == STATUS:
+            payload = header + payload
+        payload = b"\x00" * 4 + cipher.encrypt(payload, False)
+        message = TuyaMessage(seqno, cmd, 0, payload, 0, True, PREFIX_55AA, False)
+        return pack_message(message, hmac_key=key)
+
+    payload = b"\x00" * 4 + header + cipher.encrypt(payload, False)
+    message = TuyaMessage(seqno, cmd, 0, payload, 0, True, PREFIX_55AA, False)
+    return pack_message(message)
+
+
+def client_payload(version, key, data):
+    # Client frames carry no retcode, so they are decoded with tinytuya
+    # rather than with TuyaCipher.unpack, which expects device replies.
+    message = unpack_message(
+        data, hmac_key=key if version >= 3.4 else None, no_retcode=True
+    )
+    assert message.crc_good
+
+    header = f"{version:.1f}".encode() + b"\x00" * 12
+    payload = message.payload
+
+    if version < 3.4 and payload.startswith(header):
+        payload = payload[len(header) :]
+    if version < 3.5:
+        payload = AESCipher(key).decrypt(payload, False, decode_text=False)
+    if payload.startswith(header):
+        payload = payload[len(header) :]
+
+    return message.cmd, payload
+
+
+@pytest.fixture
+def fixed_iv(monkeypatch):
+    monkeypatch.setattr(tuya_local_client.os, "urandom", lambda size: IV[:size])
+
+
+@pytest.mark.parametrize(
+    "version, key, cmd",
+    [
+        (3.3, LOCAL_KEY, CONTROL),
+        (3.3, LOCAL_KEY, DP_QUERY),
+        (3.4, SESSION_KEY, CONTROL_NEW),
+        (3.4, SESSION_KEY, DP_QUERY_NEW),
+        (3.4, LOCAL_KEY, SESS_KEY_NEG_START),
+    ],
+)
+def test_pack_matches_tinytuya(version, key, cmd):
+    expected = tinytuya_device(version, key, seqno=42)._encode_message(
+        MessagePayload(cmd, PAYLOAD)
+    )
+
+    assert TuyaCipher(key, version).pack(42, cmd, PAYLOAD) == expected
+
+
+@pytest.mark.parametrize("cmd", [CONTROL_NEW, DP_QUERY_NEW, SESS_KEY_NEG_START])
+def test_pack_v35_matches_tinytuya(fixed_iv, cmd):
+    payload = PAYLOAD
+    if cmd == CONTROL_NEW:
+        payload = b"3.5" + b"\x00" * 12 + PAYLOAD
+
+    message = TuyaMessage(42, cmd, None, payload, 0, True, PREFIX_6699, IV)
+    expected = pack_message(message, hmac_key=SESSION_KEY)
+
+    assert TuyaCipher(SESSION_KEY, 3.5).pack(42, cmd, PAYLOAD) == expected
+
+
+@pytest.mark.parametrize("version", [3.3, 3.4, 3.5])
+def test_tinytuya_unpacks_packed_messages(version):
+    data = TuyaCipher(SESSION_KEY, version).pack(7, CONTROL_NEW, PAYLOAD)
+
+    assert client_payload(version, SESSION_KEY, data) == (CONTROL_NEW, PAYLOAD)
+    assert unpack_message(data, SESSION_KEY, no_retcode=True).seqno == 7
+
+
+@pytest.mark.parametrize("version", [3.3, 3.4, 3.5])
+@pytest.mark.parametrize("cmd", [STATUS, CONTROL_NEW])
+def test_unpack_tinytuya_device_replies(version, cmd):
+    data = device_reply(version, SESSION_KEY, 9, cmd, PAYLOAD)
+
+    assert TuyaCipher(SESSION_KEY, version).unpack(*split(data)) == (cmd, PAYLOAD)
+
+
+@pytest.mark.parametrize(
+    "version, error",
+    [(3.3, "CRC Mismatch"), (3.4, "HMAC Mismatch"), (3.5, "GCM Tag Mismatch")],
+)
+def test_unpack_rejects_tampered_messages(version, error):
+    data = bytearray(device_reply(version, SESSION_KEY, 9, STATUS, PAYLOAD))
+    data[-12] ^= 1
+
+    header, body = split(bytes(data))
+
+    with pytest.raises(TuyaProtocolError, match=error):
+        TuyaCipher(SESSION_KEY, version).unpack(header, body)
+
+
+def test_unpack_rejects_the_wrong_key():
+    data = device_reply(3.4, SESSION_KEY, 9, STATUS, PAYLOAD)
+
+    with pytest.raises(TuyaProtocolError, match="HMAC Mismatch"):
+        TuyaCipher(LOCAL_KEY, 3.4).unpack(*split(data))
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 17, 32])
+def test_ecb_padding_round_trips_with_tinytuya(size):
+    data = os.urandom(size)
+    cipher = TuyaCipher(LOCAL_KEY, 3.3)
+
+    assert cipher.encrypt_ecb(data) == AESCipher(LOCAL_KEY).encrypt(data, False)
+    assert cipher.decrypt_ecb(AESCipher(LOCAL_KEY).encrypt(data, False)) == data
+
+
+def test_ecb_rejects_bad_lengths_and_padding():
+    cipher = TuyaCipher(LOCAL_KEY, 3.3)
+
+    with pytest.raises(TuyaProtocolError, match="Invalid Block Length"):
+        cipher.decrypt_ecb(b"\x00" * 15)
+
+    block = AESCipher(LOCAL_KEY).encrypt(b"\x00" * 16, False, pad=False)
+    with pytest.raises(TuyaProtocolError, match="Invalid Padding"):
+        cipher.decrypt_ecb(block)
+
+
+def test_read_message_frames_both_prefixes():
+    async def main():
+        reader = asyncio.StreamReader()
+        for version in (3.4, 3.5):
+            reader.feed_data(device_reply(version, SESSION_KEY, 3, STATUS, PAYLOAD))
+        reader.feed_eof()
+
+        return [await read_message(reader), await read_message(reader)]
+
+    messages = asyncio.run(main())
+
+    assert TuyaCipher(SESSION_KEY, 3.4).unpack(*messages[0]) == (STATUS, PAYLOAD)
+    assert TuyaCipher(SESSION_KEY, 3.5).unpack(*messages[1]) == (STATUS, PAYLOAD)
+
+
+@pytest.mark.parametrize("version", [3.4, 3.5])
+def test_session_key_negotiation_matches_tinytuya(version):
+    # The fake device answers the handshake with tinytuya's framing and then
+    # decodes the first control message with the key tinytuya would derive.
+    remote_nonce = b"0123456789ABCDEF"
+    reference = tinytuya_device(version)
+    received = []
+
+    async def device(reader, writer):
+        cmd, local_nonce = client_payload(
+            version, LOCAL_KEY, b"".join(await read_message(reader))
+        )
+        assert cmd == SESS_KEY_NEG_START
+
+        response = remote_nonce + hmac.new(LOCAL_KEY, local_nonce, sha256).digest()
+        writer.write(device_reply(version, LOCAL_KEY, 1, SESS_KEY_NEG_RESP, response))
+
+        cmd, digest = client_payload(
+            version, LOCAL_KEY, b"".join(await read_message(reader))
+        )
+        assert cmd == SESS_KEY_NEG_FINISH
+        assert digest == hmac.new(LOCAL_KEY, remote_nonce, sha256).digest()
+
+        reference.local_nonce = local_nonce
+        reference.remote_nonce = remote_nonce
+        reference._negotiate_session_key_generate_finalize()
+
+        data = b"".join(await read_message(reader))
+        received.append(client_payload(version, reference.local_key, data))
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(device, "127.0.0.1", 0)
+        connection = TuyaConnection(
+            DEVICE_ID, "127.0.0.1", LOCAL_KEY.decode(), version=version
+        )
+        connection.port = server.sockets[0].getsockname()[1]
+
+        async with server:
+            assert await connection.connect()
+            assert await connection.set_values({"20": True})
+
+            for _ in range(100):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+
+            await connection.close()
+
+    asyncio.run(main())
+
+    cmd, payload = received[0]
+    assert cmd == CONTROL_NEW
+    assert payload.startswith(b'{"protocol":5,"t":')
+    assert payload.endswith(b',"data":{"dps":{"20":true}}}')
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from udp_stream_process import E131Packetizer, PixelSpreader, UDPPacketizer
+
+
+def test_spreader_covers_only_its_band_range():
+    spreader = PixelSpreader(6, (3, 6), 6)
+
+    np.testing.assert_array_equal(spreader.bands, [0, 0, 1, 1, 2, 2])
+
+    # Bands 3-5 of 0-5 sit in the green to blue half of the hue range.
+    assert spreader.palette[:, 0].max() < 0.5
+    np.testing.assert_allclose(spreader.palette[-1], [0, 0, 1])
+
+
+def test_spread_scales_pixels_by_their_band_level():
+    spreader = PixelSpreader(4, (0, 2), 2)
+    pixels = spreader.spread(np.array([255, 51], dtype=np.uint8), 255)
+
+    np.testing.assert_array_equal(pixels[:, 0], [255, 255, 0, 0])
+    np.testing.assert_array_equal(pixels[:, 2], [0, 0, 51, 51])
+    assert spreader.spread(np.zeros(2, dtype=np.uint8), 255) is None
+
+
+def test_fill_pixels_splits_the_strip_across_packets():
+    packetizer = E131Packetizer(200)
+    pixels = np.arange(600, dtype=np.uint16).reshape(200, 3).astype(np.uint8)
+
+    packets = packetizer.fill_pixels(pixels)
+
+    assert len(packets) == 2
+    np.testing.assert_array_equal(np.concatenate(packetizer.views), pixels)
+
+
+def test_packetizer_without_a_sequence_writer_cannot_be_built():
+    class HeaderOnlyPacketizer(UDPPacketizer):
+        pixels_per_packet = 100
+
+        def _write_header(self, packet, index, start, count, **options):
+            pass
+
+    with pytest.raises(TypeError, match="_write_sequence"):
+        HeaderOnlyPacketizer(10)
@@ -0,0 +1,104 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from time import time
+from typing import List, Tuple
+
+from tinytuya import BulbDevice, scanner
+
+logger = logging.getLogger(__name__)
+
+
+class TuyaDeviceCache:
+    def __init__(
+        self,
+        path: str = "tuya_devices.json",
+        connect_timeout: float = 1,
+        listen_time: float = 6,
+    ) -> None:
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.listen_time = listen_time
+
+    def load(self) -> List[dict]:
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, "r") as f:
+            return loads(f.read())["devices"]
+
+    def save(self, devices: List[dict]) -> None:
+        with open(self.path, "w") as f:
+            f.write(dumps({"updated": time(), "devices": devices}, indent=4))
+
+    def __connect(self, device: dict) -> bool:
+        light = BulbDevice(
+            dev_id=device["id"],
+            address=device["ip_address"],
+            local_key=device["local_key"],
+            version=device["version"],
+            connection_timeout=self.connect_timeout,
+            connection_retry_limit=1,
+            connection_retry_delay=0,
+        )
+
+        try:
+            return "dps" in light.status()
+        except Exception:
+            return False
+        finally:
+            light.close()
+
+    def __listen(self, devices: List[dict]) -> List[dict]:
+        try:
+            found = scanner.devices(
+                verbose=False,
+                scantime=self.listen_time,
+                poll=False,
+                byID=True,
+                wantids=[device["id"] for device in devices],
+            )
+        except Exception as e:
+            logger.warning(f"Device Listen Failed: {e!r}")
+
+            return []
+
+        relocated = []
+        for device in devices:
+            if device["id"] not in found:
+                continue
+
+            broadcast = found[device["id"]]
+            device = {
+                **device,
+                "ip_address": broadcast["ip"],
+                "version": broadcast.get("version", device["version"]),
+            }
+
+            if self.__connect(device):
+                relocated.append(device)
+
+        return relocated
+
+    def revalidate(self, devices: List[dict]) -> Tuple[List[dict], List[dict]]:
+        with ThreadPoolExecutor(max_workers=max(len(devices), 1)) as executor:
+            reachable = list(executor.map(self.__connect, devices))
+
+        valid = [device for device, ok in zip(devices, reachable) if ok]
+        unreachable = [device for device, ok in zip(devices, reachable) if not ok]
+
+        if unreachable:
+            logger.warning(
+                f"Unreachable Devices: {[device['name'] for device in unreachable]}"
+            )
+
+            relocated = self.__listen(unreachable)
+            relocated_ids = {device["id"] for device in relocated}
+
+            valid.extend(relocated)
+            unreachable = [
+                device for device in unreachable if device["id"] not in relocated_ids
+            ]
+
+        return valid, unreachable
@@ -0,0 +1,501 @@
+import asyncio
+import hmac
+import logging
+import os
+import struct
+import zlib
+from hashlib import sha256
+from json import dumps, loads
+from time import monotonic, time
+from typing import Dict, Set, Tuple
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+logger = logging.getLogger(__name__)
+
+PREFIX_55AA = 0x000055AA
+SUFFIX_55AA = 0x0000AA55
+PREFIX_6699 = 0x00006699
+SUFFIX_6699 = 0x00009966
+
+HEADER_55AA = struct.Struct(">4I")
+HEADER_6699 = struct.Struct(">IHIII")
+UINT32 = struct.Struct(">I")
+END_55AA = struct.Struct(">2I")
+END_HMAC = struct.Struct(">32sI")
+
+SESS_KEY_NEG_START = 3
+SESS_KEY_NEG_RESP = 4
+SESS_KEY_NEG_FINISH = 5
+CONTROL = 7
+STATUS = 8
+HEART_BEAT = 9
+DP_QUERY = 10
+CONTROL_NEW = 13
+DP_QUERY_NEW = 16
+
+NO_VERSION_HEADER = (
+    DP_QUERY,
+    DP_QUERY_NEW,
+    HEART_BEAT,
+    SESS_KEY_NEG_START,
+    SESS_KEY_NEG_RESP,
+    SESS_KEY_NEG_FINISH,
+)
+
+MAX_PAYLOAD = 0xFFFF
+
+
+class TuyaProtocolError(Exception):
+    pass
+
+
+class TuyaCipher:
+    def __init__(self, key: bytes, version: float) -> None:
+        self.version = version
+        self.version_header = f"{version:.1f}".encode() + b"\x00" * 12
+
+        # Key schedules are built once per session and reused for every
+        # message; ECB is stateless per block so one encryptor serves all.
+        self.__hmac = hmac.new(key, digestmod=sha256)
+
+        if version >= 3.5:
+            self.__gcm = AESGCM(key)
+        else:
+            cipher = Cipher(algorithms.AES(key), modes.ECB())
+            self.__encryptor = cipher.encryptor()
+            self.__decryptor = cipher.decryptor()
+
+    def encrypt_ecb(self, data: bytes) -> bytes:
+        pad = 16 - len(data) % 16
+
+        return self.__encryptor.update(data + bytes((pad,)) * pad)
+
+    def decrypt_ecb(self, data: bytes) -> bytes:
+        if len(data) % 16:
+            raise TuyaProtocolError(f"Invalid Block Length: {len(data)}")
+
+        data = self.__decryptor.update(data)
+        pad = data[-1]
+
+        if not 1 <= pad <= 16:
+            raise TuyaProtocolError("Invalid Padding")
+
+        return data[:-pad]
+
+    def digest(self, data: bytes) -> bytes:
+        mac = self.__hmac.copy()
+        mac.update(data)
+
+        return mac.digest()
+
+    def pack(self, seqno: int, cmd: int, payload: bytes) -> bytes:
+        if self.version >= 3.5:
+            if cmd not in NO_VERSION_HEADER:
+                payload = self.version_header + payload
+
+            header = HEADER_6699.pack(PREFIX_6699, 0, seqno, cmd, len(payload) + 28)
+            iv = os.urandom(12)
+
+            return (
+                header
+                + iv
+                + self.__gcm.encrypt(iv, payload, header[4:])
+                + UINT32.pack(SUFFIX_6699)
+            )
+
+        if self.version >= 3.4:
+            if cmd not in NO_VERSION_HEADER:
+                payload = self.version_header + payload
+            payload = self.encrypt_ecb(payload)
+
+            data = HEADER_55AA.pack(PREFIX_55AA, seqno, cmd, len(payload) + 36)
+            data += payload
+
+            return data + END_HMAC.pack(self.digest(data), SUFFIX_55AA)
+
+        payload = self.encrypt_ecb(payload)
+        if cmd not in NO_VERSION_HEADER:
+            payload = self.version_header + payload
+
+        data = HEADER_55AA.pack(PREFIX_55AA, seqno, cmd, len(payload) + 8)
+        data += payload
+
+        return data + END_55AA.pack(zlib.crc32(data), SUFFIX_55AA)
+
+    def unpack(self, header: bytes, body: bytes) -> Tuple[int, bytes]:
+        if self.version >= 3.5:
+            _, _, _, cmd, _ = HEADER_6699.unpack(header)
+
+            try:
+                payload = self.__gcm.decrypt(body[:12], body[12:-4], header[4:])
+            except Exception:
+                raise TuyaProtocolError("GCM Tag Mismatch")
+
+            payload = payload[4:]
+        else:
+            _, _, cmd, _ = HEADER_55AA.unpack(header)
+
+            if self.version >= 3.4:
+                end = END_HMAC.size
+                if self.digest(header + body[:-end]) != body[-end:-4]:
+                    raise TuyaProtocolError("HMAC Mismatch")
+            else:
+                end = END_55AA.size
+                if zlib.crc32(header + body[:-end]) != UINT32.unpack(body[-end:-4])[0]:
+                    raise TuyaProtocolError("CRC Mismatch")
+
+            payload = body[4:-end]
+
+            if payload and self.version >= 3.4:
+                payload = self.decrypt_ecb(payload)
+            elif payload:
+                if payload.startswith(self.version_header[:3]):
+                    payload = payload[len(self.version_header) :]
+                payload = self.decrypt_ecb(payload)
+
+        if payload.startswith(self.version_header[:3]):
+            payload = payload[len(self.version_header) :]
+
+        return cmd, payload
+
+
+def encode_json(message: dict) -> bytes:
+    return dumps(message, separators=(",", ":")).encode()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[bytes, bytes]:
+    prefix = await reader.readexactly(4)
+
+    if prefix == UINT32.pack(PREFIX_6699):
+        header = prefix + await reader.readexactly(HEADER_6699.size - 4)
+        length = HEADER_6699.unpack(header)[4] + 4
+    elif prefix == UINT32.pack(PREFIX_55AA):
+        header = prefix + await reader.readexactly(HEADER_55AA.size - 4)
+        length = HEADER_55AA.unpack(header)[3]
+    else:
+        raise TuyaProtocolError(f"Unknown Prefix: {prefix.hex()}")
+
+    if length > MAX_PAYLOAD:
+        raise TuyaProtocolError(f"Message Too Large: {length}")
+
+    return header, await reader.readexactly(length)
+
+
+class TuyaConnection:
+    port = 6668
+
+    def __init__(
+        self,
+        device_id: str,
+        address: str,
+        local_key: str,
+        version: float | str = 3.3,
+        timeout: float = 1,
+        heartbeat_interval: float = 10,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+    ) -> None:
+        self.id = device_id
+        self.address = address
+        self.version = float(version)
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.__local_key = local_key.encode("latin1")
+
+        # Control messages are spliced from bytes so a cached DPS value skips
+        # JSON encoding; only the timestamp changes between frames.
+        if self.version >= 3.4:
+            self.__control = (
+                CONTROL_NEW,
+                b'{"protocol":5,"t":',
+                b',"data":{"dps":',
+                b"}}",
+            )
+        else:
+            device = dumps(device_id)[1:-1].encode()
+            self.__control = (
+                CONTROL,
+                b'{"devId":"' + device + b'","uid":"' + device + b'","t":"',
+                b'","dps":',
+                b"}",
+            )
+
+        self.__seqno = 1
+        self.__cipher: TuyaCipher | None = None
+        self.__writer: asyncio.StreamWriter | None = None
+        self.__tasks: Set[asyncio.Task] = set()
+        self.__status: asyncio.Future | None = None
+        self.__acks: Dict[int, asyncio.Future] = {}
+        self.__last_received = 0.0
+        self.__closing = False
+
+        self.connected = False
+        self.sent = 0
+        self.skipped = 0
+        self.heartbeats = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    async def connect(self) -> bool:
+        try:
+            await self.__open()
+        except (OSError, EOFError, asyncio.TimeoutError, TuyaProtocolError) as e:
+            logger.warning(f"Connect Failed ({self.id}): {e!r}")
+            return False
+
+        self.__spawn(self.__heartbeat())
+
+        return True
+
+    async def __open(self) -> None:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.address, self.port), self.timeout
+        )
+
+        self.__seqno = 1
+        cipher = TuyaCipher(self.__local_key, self.version)
+
+        try:
+            if self.version >= 3.4:
+                cipher = await asyncio.wait_for(
+                    self.__negotiate(reader, writer, cipher), self.timeout
+                )
+        except BaseException:
+            writer.close()
+            raise
+
+        self.__cipher = cipher
+        self.__writer = writer
+        self.__last_received = monotonic()
+        self.connected = True
+
+        self.__spawn(self.__read_loop(reader, writer))
+
+    async def __negotiate(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        cipher: TuyaCipher,
+    ) -> TuyaCipher:
+        local_nonce = os.urandom(16)
+
+        writer.write(cipher.pack(self.__next_seqno(), SESS_KEY_NEG_START, local_nonce))
+        await writer.drain()
+
+        while True:
+            cmd, payload = cipher.unpack(*await read_message(reader))
+            if cmd == SESS_KEY_NEG_RESP and payload:
+                break
+
+        if len(payload) < 48 or payload[16:48] != cipher.digest(local_nonce):
+            raise TuyaProtocolError("Session Key Negotiation Failed")
+
+        remote_nonce = payload[:16]
+
+        writer.write(
+            cipher.pack(
+                self.__next_seqno(), SESS_KEY_NEG_FINISH, cipher.digest(remote_nonce)
+            )
+        )
+        await writer.drain()
+
+        nonce = bytes(a ^ b for a, b in zip(local_nonce, remote_nonce))
+        if self.version >= 3.5:
+            session_key = AESGCM(self.__local_key).encrypt(
+                local_nonce[:12], nonce, None
+            )
+            session_key = session_key[:16]
+        else:
+            session_key = (
+                Cipher(algorithms.AES(self.__local_key), modes.ECB())
+                .encryptor()
+                .update(nonce)
+            )
+
+        return TuyaCipher(session_key, self.version)
+
+    def __next_seqno(self) -> int:
+        seqno = self.__seqno
+        self.__seqno += 1
+
+        return seqno
+
+    def __spawn(self, coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __read_loop(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                cmd, payload = self.__cipher.unpack(*await read_message(reader))
+                self.__last_received = monotonic()
+
+                self.__dispatch(cmd, payload)
+        except (OSError, asyncio.IncompleteReadError, TuyaProtocolError) as e:
+            if not self.__closing:
+                logger.warning(f"Connection Lost ({self.id}): {e!r}")
+        finally:
+            self.connected = False
+            writer.close()
+
+            for future in [self.__status, *self.__acks.values()]:
+                if future and not future.done():
+                    future.set_exception(ConnectionError("Connection Lost"))
+            self.__acks.clear()
+
+        if not self.__closing:
+            self.__spawn(self.__reconnect())
+
+    def __dispatch(self, cmd: int, payload: bytes) -> None:
+        ack = self.__acks.pop(cmd, None)
+        if ack and not ack.done():
+            ack.set_result(payload)
+
+        if not payload or cmd not in (STATUS, DP_QUERY, DP_QUERY_NEW):
+            return
+
+        try:
+            message = loads(payload)
+        except ValueError:
+            return
+
+        dps = message.get("dps") or message.get("data", {}).get("dps")
+        if dps is not None and self.__status and not self.__status.done():
+            self.__status.set_result(dps)
+
+    async def __reconnect(self) -> None:
+        delay = self.backoff
+
+        while not self.__closing and not self.connected:
+            await asyncio.sleep(delay)
+
+            try:
+                await self.__open()
+                self.reconnects += 1
+                logger.info(f"Reconnected ({self.id})")
+            except (OSError, EOFError, asyncio.TimeoutError, TuyaProtocolError) as e:
+                logger.debug("Reconnect Failed (%s): %r", self.id, e)
+                delay = min(delay * 2, self.max_backoff)
+
+    async def __heartbeat(self) -> None:
+        while not self.__closing:
+            await asyncio.sleep(self.heartbeat_interval)
+
+            if not self.connected:
+                continue
+
+            # Devices answer every heartbeat, so silence means a dead link.
+            if monotonic() - self.__last_received > self.heartbeat_interval * 2.5:
+                logger.warning(f"Heartbeat Timeout ({self.id})")
+                self.__writer.close()
+                continue
+
+            if await self.__write(HEART_BEAT, {"gwId": self.id, "devId": self.id}):
+                self.heartbeats += 1
+
+    async def __write(self, cmd: int, message: dict | bytes) -> bool:
+        if not self.connected:
+            return False
+
+        payload = message
+        if isinstance(message, dict):
+            payload = encode_json(message)
+
+        try:
+            self.__writer.write(self.__cipher.pack(self.__next_seqno(), cmd, payload))
+            await self.__writer.drain()
+        except OSError as e:
+            self.errors += 1
+            logger.debug("Write Failed (%s): %r", self.id, e)
+            return False
+
+        return True
+
+    async def status(self) -> dict:
+        self.__status = asyncio.get_running_loop().create_future()
+
+        if self.version >= 3.4:
+            sent = await self.__write(DP_QUERY_NEW, {})
+        else:
+            sent = await self.__write(
+                DP_QUERY,
+                {
+                    "gwId": self.id,
+                    "devId": self.id,
+                    "uid": self.id,
+                    "t": str(int(time())),
+                },
+            )
+
+        if not sent:
+            raise ConnectionError("Not Connected")
+
+        return await asyncio.wait_for(self.__status, self.timeout)
+
+    def control_message(self, dps: bytes) -> Tuple[int, bytes]:
+        cmd, head, middle, end = self.__control
+
+        return cmd, b"".join((head, str(int(time())).encode(), middle, dps, end))
+
+    async def set_values(self, dps: dict | bytes, nowait: bool = True) -> bool:
+        if isinstance(dps, dict):
+            dps = encode_json(dps)
+
+        cmd, message = self.control_message(dps)
+
+        # Frames still queued in the transport mean the device is behind;
+        # adding more would only deliver stale colours later.
+        if (
+            nowait
+            and self.connected
+            and self.__writer.transport.get_write_buffer_size()
+        ):
+            self.skipped += 1
+            return False
+
+        ack = None
+        if not nowait:
+            ack = self.__acks[cmd] = asyncio.get_running_loop().create_future()
+
+        if not await self.__write(cmd, message):
+            self.__acks.pop(cmd, None)
+            return False
+
+        self.sent += 1
+
+        if ack:
+            try:
+                await asyncio.wait_for(ack, self.timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                return False
+
+        return True
+
+    async def close(self) -> None:
+        self.__closing = True
+
+        for task in list(self.__tasks):
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+
+        if self.__writer:
+            self.__writer.close()
+
+        self.connected = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "heartbeats": self.heartbeats,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+        }
@@ -0,0 +1,388 @@
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from json import loads
+from multiprocessing.connection import Connection
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from backend_process import BackendProcess, Group, Stamps
+from frame_math import clip, hsv_to_rgb, quantize
+from frame_ring_buffer import FrameRingBuffer
+
+logger = logging.getLogger(__name__)
+
+DDP_HEADER = 10
+DDP_MAX_PIXELS = 480
+DDP_PUSH = 0x41
+DDP_RGB8 = 0x0B
+
+E131_HEADER = 126
+DMX_PIXELS = 170
+
+ARTNET_HEADER = 18
+
+
+def load_udp_devices(path: str | None) -> List[dict]:
+    if not path or not os.path.exists(path):
+        return []
+
+    with open(path, "r") as f:
+        return loads(f.read())
+
+
+class UDPPacketizer(ABC):
+    port = 0
+    pixels_per_packet = 0
+    header_size = 0
+
+    def __init__(self, pixels: int, universe: int = 1, **options) -> None:
+        self.pixels = pixels
+        self.universe = universe
+        self.sequence = 0
+
+        # Every packet is built once; a frame only rewrites pixel bytes and
+        # the sequence number in place.
+        self.packets: List[bytearray] = []
+        self.views: List[np.ndarray] = []
+        self.starts: List[int] = []
+
+        for i, start in enumerate(range(0, pixels, self.pixels_per_packet)):
+            count = min(self.pixels_per_packet, pixels - start)
+            packet = bytearray(self.header_size + self._payload_size(count))
+
+            self._write_header(packet, i, start, count, **options)
+
+            self.packets.append(packet)
+            self.starts.append(start)
+            self.views.append(
+                np.frombuffer(
+                    packet, dtype=np.uint8, count=count * 3, offset=self.header_size
+                ).reshape(count, 3)
+            )
+
+    def _payload_size(self, count: int) -> int:
+        return count * 3
+
+    @abstractmethod
+    def _write_header(
+        self, packet: bytearray, index: int, start: int, count: int, **options
+    ) -> None: ...
+
+    @abstractmethod
+    def _write_sequence(self, packet: bytearray) -> None: ...
+
+    def fill(self, rgb_color: List[int]) -> List[bytearray]:
+        self.sequence = self.sequence % 255 + 1
+
+        for packet, view in zip(self.packets, self.views):
+            view[:] = rgb_color
+            self._write_sequence(packet)
+
+        return self.packets
+
+    def fill_pixels(self, pixels: np.ndarray) -> List[bytearray]:
+        self.sequence = self.sequence % 255 + 1
+
+        for packet, view, start in zip(self.packets, self.views, self.starts):
+            view[:] = pixels[start : start + view.shape[0]]
+            self._write_sequence(packet)
+
+        return self.packets
+
+
+class PixelSpreader:
+    def __init__(
+        self, pixels: int, band_range: Tuple[int, int], band_count: int
+    ) -> None:
+        start, stop = band_range
+
+        # Each pixel shows one band of its group, hued from red for the lows
+        # to blue for the highs like the rgb layout.
+        self.bands = np.arange(pixels) * (stop - start) // pixels
+        hues = (start + self.bands) / max(band_count - 1, 1) * 240
+        self.palette = hsv_to_rgb(
+            np.stack([hues, np.ones(pixels), np.full(pixels, 1 / 255)], axis=1)
+        )
+
+        self.__levels = np.empty(pixels, dtype=np.uint8)
+        self.__colors = np.empty((pixels, 3), dtype=np.float64)
+        self.pixels = np.empty((pixels, 3), dtype=np.uint8)
+
+    def spread(self, levels: np.ndarray, brightness: int) -> np.ndarray | None:
+        peak = levels.max()
+        if not peak:
+            return None
+
+        np.take(levels, self.bands, out=self.__levels)
+        np.multiply(self.palette, self.__levels[:, None], out=self.__colors)
+
+        # A beat lifts the group brightness above its loudest band.
+        if brightness != peak:
+            np.multiply(self.__colors, brightness / peak, out=self.__colors)
+
+        return quantize(clip(self.__colors, out=self.__colors), out=self.pixels)
+
+
+class DDPPacketizer(UDPPacketizer):
+    port = 4048
+    pixels_per_packet = DDP_MAX_PIXELS
+    header_size = DDP_HEADER
+
+    def _write_header(
+        self, packet: bytearray, index: int, start: int, count: int, **options
+    ) -> None:
+        # Only the last packet of a frame asks the controller to display it.
+        last = start + count >= self.pixels
+        packet[0] = DDP_PUSH if last else DDP_PUSH & ~0x01
+        packet[2] = DDP_RGB8
+        packet[3] = 1
+        packet[4:8] = (start * 3).to_bytes(4, "big")
+        packet[8:10] = (count * 3).to_bytes(2, "big")
+
+    def _write_sequence(self, packet: bytearray) -> None:
+        packet[1] = (self.sequence - 1) % 15 + 1
+
+
+class E131Packetizer(UDPPacketizer):
+    port = 5568
+    pixels_per_packet = DMX_PIXELS
+    header_size = E131_HEADER
+
+    def _payload_size(self, count: int) -> int:
+        return 512
+
+    def _write_header(
+        self,
+        packet: bytearray,
+        index: int,
+        start: int,
+        count: int,
+        cid: bytes = b"",
+        source_name: str = "vibe-lights",
+        priority: int = 100,
+        **options,
+    ) -> None:
+        length = len(packet)
+
+        # Root layer
+        packet[0:2] = (0x0010).to_bytes(2, "big")
+        packet[4:16] = b"ASC-E1.17\x00\x00\x00"
+        packet[16:18] = (0x7000 | (length - 16)).to_bytes(2, "big")
+        packet[18:22] = (0x00000004).to_bytes(4, "big")
+        packet[22:38] = cid.ljust(16, b"\x00")[:16]
+
+        # Framing layer
+        packet[38:40] = (0x7000 | (length - 38)).to_bytes(2, "big")
+        packet[40:44] = (0x00000002).to_bytes(4, "big")
+        packet[44:108] = source_name.encode()[:63].ljust(64, b"\x00")
+        packet[108] = priority
+        packet[113:115] = (self.universe + index).to_bytes(2, "big")
+
+        # DMP layer
+        packet[115:117] = (0x7000 | (length - 115)).to_bytes(2, "big")
+        packet[117] = 0x02
+        packet[118] = 0xA1
+        packet[121:123] = (0x0001).to_bytes(2, "big")
+        packet[123:125] = (513).to_bytes(2, "big")
+
+    def _write_sequence(self, packet: bytearray) -> None:
+        packet[111] = self.sequence
+
+
+class ArtNetPacketizer(UDPPacketizer):
+    port = 6454
+    pixels_per_packet = DMX_PIXELS
+    header_size = ARTNET_HEADER
+
+    def _payload_size(self, count: int) -> int:
+        return count * 3 + count * 3 % 2
+
+    def _write_header(
+        self, packet: bytearray, index: int, start: int, count: int, **options
+    ) -> None:
+        universe = self.universe + index
+
+        packet[0:8] = b"Art-Net\x00"
+        packet[8:10] = (0x5000).to_bytes(2, "little")
+        packet[10:12] = (14).to_bytes(2, "big")
+        packet[14] = universe & 0xFF
+        packet[15] = (universe >> 8) & 0x7F
+        packet[16:18] = (len(packet) - ARTNET_HEADER).to_bytes(2, "big")
+
+    def _write_sequence(self, packet: bytearray) -> None:
+        packet[12] = self.sequence
+
+
+class UDPStreamProcess(BackendProcess):
+    packetizer_class = UDPPacketizer
+    frame_timeout = 1.0
+    streaming = True
+
+    def __init__(
+        self,
+        process_connection: Connection,
+        frame_buffer: FrameRingBuffer,
+        **options,
+    ) -> None:
+        super().__init__(process_connection, frame_buffer, **options)
+
+        self.__devices_path = os.getenv("UDP_DEVICES", "udp_devices.json")
+
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_dropped = 0
+
+    def _default_host(self, universe: int) -> str | None:
+        return None
+
+    def _packetizer_options(self) -> dict:
+        return {}
+
+    def _setup(self) -> Tuple[List[str], Dict[str, str]] | None:
+        devices = load_udp_devices(self.__devices_path)
+
+        if not devices:
+            logger.error(f"No UDP Devices In {self.__devices_path}")
+            return None
+
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.__socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.__socket.setblocking(False)
+
+        options = self._packetizer_options()
+
+        self.__packetizers = {}
+        self.__addresses = {}
+        self.__spreaders = {}
+
+        for device in devices:
+            packetizer = self.packetizer_class(
+                int(device["pixels"]), int(device.get("universe", 1)), **options
+            )
+            hosts = [
+                device.get("host") or self._default_host(packetizer.universe + i)
+                for i in range(len(packetizer.packets))
+            ]
+
+            if None in hosts:
+                logger.error(f"UDP Device {device['name']} Has No Host")
+                return None
+
+            port = int(device.get("port", packetizer.port))
+
+            self.__packetizers[device["name"]] = packetizer
+            self.__addresses[device["name"]] = [(host, port) for host in hosts]
+
+            logger.info(
+                f"{device['name']}: {packetizer.pixels} Pixels In"
+                f" {len(packetizer.packets)} Packets"
+            )
+
+        return list(self.__packetizers), {}
+
+    def __send(self, packets: List[Tuple[bytearray, Tuple[str, int]]]) -> None:
+        # No sendmmsg in the standard library; a tight loop of non-blocking
+        # sendto calls on one socket is the closest equivalent.
+        for packet, address in packets:
+            try:
+                self.bytes_sent += self.__socket.sendto(packet, address)
+                self.packets_sent += 1
+            except (BlockingIOError, InterruptedError):
+                self.packets_dropped += 1
+                self._record_error("buffer_full")
+            except OSError as e:
+                self.packets_dropped += 1
+                self._record_error("os_error")
+                logger.debug("UDP Send Failed: %r", e)
+
+    def _submit(self, groups: List[Group], stamps: Stamps) -> None:
+        packets = []
+
+        for i, lights, br, cl in groups:
+            levels = self.light_mapping.band_levels(i)
+
+            for light in lights:
+                packetizer = self.__packetizers[light]
+                pixels = self.__spreader(light, i).spread(levels, br)
+
+                # Silent bands leave only a flat colour, e.g. a beat accent.
+                packets.extend(
+                    zip(
+                        (
+                            packetizer.fill(cl)
+                            if pixels is None
+                            else packetizer.fill_pixels(pixels)
+                        ),
+                        self.__addresses[light],
+                    )
+                )
+
+        self.__send(packets)
+        self._record_send(stamps)
+
+    def __spreader(self, light: str, group: int) -> PixelSpreader:
+        # Each group spreads its own band range.
+        key = (light, group)
+        if key not in self.__spreaders:
+            self.__spreaders[key] = PixelSpreader(
+                self.__packetizers[light].pixels,
+                self.light_mapping.band_ranges[group],
+                self.light_mapping.band_count,
+            )
+
+        return self.__spreaders[key]
+
+    def _stats(self) -> Dict[str, dict]:
+        return {
+            "UDP": {
+                "packets_sent": self.packets_sent,
+                "bytes_sent": self.bytes_sent,
+                "packets_dropped": self.packets_dropped,
+            }
+        }
+
+    def _teardown(self) -> None:
+        packets = []
+
+        for light, packetizer in self.__packetizers.items():
+            packets.extend(zip(packetizer.fill([0, 0, 0]), self.__addresses[light]))
+
+        self.__socket.setblocking(True)
+        self.__send(packets)
+        self.__socket.close()
+
+        logger.info("Lights Blacked Out")
+
+
+class DDPStreamProcess(UDPStreamProcess):
+    backend_name = "ddp"
+    packetizer_class = DDPPacketizer
+
+
+class E131StreamProcess(UDPStreamProcess):
+    backend_name = "e131"
+    packetizer_class = E131Packetizer
+
+    def _default_host(self, universe: int) -> str:
+        # Each universe has its own multicast group.
+        return f"239.255.{universe >> 8}.{universe & 0xFF}"
+
+    def _packetizer_options(self) -> dict:
+        return {
+            "cid": uuid.uuid4().bytes,
+            "source_name": os.getenv("E131_SOURCE_NAME", "vibe-lights"),
+            "priority": int(os.getenv("E131_PRIORITY", 100)),
+        }
+
+
+class ArtNetStreamProcess(UDPStreamProcess):
+    backend_name = "artnet"
+    packetizer_class = ArtNetPacketizer
+
+    def _default_host(self, universe: int) -> str:
+        return "255.255.255.255"
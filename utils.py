@@ -1,2 +1,24 @@
-def clamp(lower, data, upper):
-    return sorted([lower, data, upper])[1]
+import os
+
+
+def stream_options_from_env() -> dict:
+    band_edges = os.getenv("BAND_EDGES")
+    latency = os.getenv("AUDIO_LATENCY")
+
+    return {
+        "ms": float(os.getenv("SMOOTHING_MS", 500)),
+        "output_ms": float(os.getenv("OUTPUT_MS", 50)),
+        "smoothing": os.getenv("SMOOTHING", "mean"),
+        "latency": latency if latency in (None, "low", "high") else float(latency),
+        "blocksize": int(os.getenv("BLOCKSIZE", 1024)),
+        "band_layout": os.getenv("BAND_LAYOUT", "rgb"),
+        "band_count": int(os.getenv("BAND_COUNT", 3)),
+        "band_edges": list(map(float, band_edges.split(","))) if band_edges else None,
+        "onset_sensitivity": float(os.getenv("ONSET_SENSITIVITY", 1.5)),
+        "onset_window_ms": float(os.getenv("ONSET_WINDOW_MS", 1000)),
+        "onset_min_interval_ms": float(os.getenv("ONSET_MIN_INTERVAL_MS", 100)),
+        "normalize": os.getenv("NORMALIZE", "1") == "1",
+        "normalize_decay_ms": float(os.getenv("NORMALIZE_DECAY_MS", 5000)),
+        "normalize_range_db": float(os.getenv("NORMALIZE_RANGE_DB", 24)),
+        "normalize_gate_db": float(os.getenv("NORMALIZE_GATE_DB", -70)),
+    }